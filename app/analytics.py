@@ -0,0 +1,202 @@
+import calendar
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict
+
+from sqlalchemy import String, cast, func, literal, null, select, union_all
+from sqlalchemy.orm import Session
+
+from .models import WaterLog, WaterCategory, ArchivedDailyUsage, USAGE_COLUMNS
+from .queries import user_id_for
+
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+DASHBOARD_SECTIONS = ["summary", "by_week", "by_month"]
+
+
+def daily_usage(db: Session, username: str, resources, start: date, end: date, by_category: bool = False) -> dict:
+    """
+    Per-day usage totals between start and end (inclusive) for each of the
+    given resources, fetched as one UNION ALL query over the hot log tables
+    and the archived daily totals. Returns {resource: {day: total}}; with
+    by_category, water totals are keyed by (day, category) instead.
+    """
+    user_id = user_id_for(username)
+    selects = []
+    for resource in resources:
+        column = USAGE_COLUMNS[resource]
+        model = column.class_
+        group_by = [model.date]
+        category = cast(null(), String)
+        if resource == "water" and by_category:
+            category = cast(WaterLog.category, String)
+            group_by.append(WaterLog.category)
+        selects.append(
+            select(
+                literal(resource).label("resource"),
+                model.date.label("day"),
+                category.label("category"),
+                func.sum(column).label("total"),
+            )
+            .where(model.user_id == user_id, model.date >= start, model.date <= end)
+            .group_by(*group_by)
+        )
+
+        archived_group_by = [ArchivedDailyUsage.date]
+        archived_category = cast(null(), String)
+        if resource == "water" and by_category:
+            archived_category = ArchivedDailyUsage.category
+            archived_group_by.append(ArchivedDailyUsage.category)
+        selects.append(
+            select(
+                literal(resource).label("resource"),
+                ArchivedDailyUsage.date.label("day"),
+                archived_category.label("category"),
+                func.sum(ArchivedDailyUsage.total).label("total"),
+            )
+            .where(
+                ArchivedDailyUsage.user_id == user_id,
+                ArchivedDailyUsage.resource == resource,
+                ArchivedDailyUsage.date >= start,
+                ArchivedDailyUsage.date <= end,
+            )
+            .group_by(*archived_group_by)
+        )
+
+    usage = {resource: defaultdict(float) for resource in resources}
+    if not selects:
+        return usage
+    for row in db.execute(union_all(*selects)):
+        # Enum columns are stored by member name
+        key = (row.day, WaterCategory[row.category]) if row.category is not None else row.day
+        # A day can have both hot and archived rows (logs backdated after archiving)
+        usage[row.resource][key] += row.total or 0
+    return usage
+
+
+def total_usage(db: Session, username: str) -> dict:
+    """
+    All-time usage per resource across hot and archived logs, in one query.
+    """
+    user_id = user_id_for(username)
+    selects = []
+    for resource, column in USAGE_COLUMNS.items():
+        model = column.class_
+        selects.append(
+            select(literal(resource).label("resource"), func.sum(column).label("total"))
+            .where(model.user_id == user_id)
+        )
+    selects.append(
+        select(ArchivedDailyUsage.resource.label("resource"), func.sum(ArchivedDailyUsage.total).label("total"))
+        .where(ArchivedDailyUsage.user_id == user_id)
+        .group_by(ArchivedDailyUsage.resource)
+    )
+    totals = {resource: 0 for resource in USAGE_COLUMNS}
+    for row in db.execute(union_all(*selects)):
+        totals[row.resource] += row.total or 0
+    return totals
+
+
+def by_day(totals: dict) -> Dict[date, float]:
+    """
+    Collapse (day, category)-keyed totals to per-day totals.
+    """
+    daily = defaultdict(float)
+    for key, qty in totals.items():
+        daily[key[0] if isinstance(key, tuple) else key] += qty
+    return daily
+
+
+def usage_summary(daily: Dict[date, float], today: date) -> dict:
+    """
+    GenSummaryResponse-style totals for today, this week and this month.
+    """
+    start_of_week = today - timedelta(days=today.weekday())
+    start_of_month = today.replace(day=1)
+    return {
+        "today": daily.get(today, 0),
+        "this_week": sum(qty for day, qty in daily.items() if start_of_week <= day <= today),
+        "this_month": sum(qty for day, qty in daily.items() if start_of_month <= day <= today),
+    }
+
+
+def week_series(daily: Dict[date, float], today: date) -> list:
+    """
+    Totals for each day of the current week, shaped like /logs-by-week.
+    """
+    start_of_week = today - timedelta(days=today.weekday())
+    return [
+        {"name": name, "qty": daily.get(start_of_week + timedelta(days=offset), 0)}
+        for offset, name in enumerate(DAY_NAMES)
+    ]
+
+
+def month_series(daily: Dict[date, float], today: date) -> list:
+    """
+    Totals for each month of the current year, shaped like /logs-by-month.
+    """
+    months = [0] * 12
+    for day, qty in daily.items():
+        if day.year == today.year:
+            months[day.month - 1] += qty
+    return [{"name": calendar.month_name[i + 1][:3], "qty": qty} for i, qty in enumerate(months)]
+
+
+def category_breakdown(totals: dict, start: date, end: date) -> list:
+    """
+    Water totals per category between start and end, shaped like the
+    pie=true variants of the water endpoints.
+    """
+    categories = defaultdict(float)
+    for (day, category), qty in totals.items():
+        if start <= day <= end:
+            categories[category] += qty
+    return [{"category": category, "total_qty": qty} for category, qty in categories.items()]
+
+
+def dashboard(db: Session, username: str, resources=("water", "energy"), sections=DASHBOARD_SECTIONS, pie: bool = False) -> dict:
+    """
+    Any combination of the summary, weekly and monthly views for water and
+    energy (plus the water category pies) from a single query, covering the
+    smallest date window the requested sections need.
+    """
+    today = datetime.now().date()
+    start_of_week = today - timedelta(days=today.weekday())
+    end_of_week = start_of_week + timedelta(days=6)
+    start_of_month = today.replace(day=1)
+    end_of_month = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+
+    starts, ends = [start_of_week, start_of_month], [today]
+    if "by_week" in sections:
+        ends.append(end_of_week)
+    if pie:
+        ends.extend([end_of_week, end_of_month])
+    if "by_month" in sections:
+        starts.append(today.replace(month=1, day=1))
+        ends.append(today.replace(month=12, day=31))
+
+    usage = daily_usage(db, username, resources, min(starts), max(ends), by_category=pie)
+
+    result = {}
+    for resource in resources:
+        daily = by_day(usage[resource])
+        views = {}
+        if "summary" in sections:
+            views["summary"] = usage_summary(daily, today)
+        if "by_week" in sections:
+            views["by_week"] = week_series(daily, today)
+        if "by_month" in sections:
+            views["by_month"] = month_series(daily, today)
+        if pie and resource == "water":
+            views["pie_week"] = category_breakdown(usage[resource], start_of_week, end_of_week)
+            views["pie_month"] = category_breakdown(usage[resource], start_of_month, end_of_month)
+        result[resource] = views
+    return result
+
+
+def live_snapshot(db: Session, username: str) -> dict:
+    """
+    Summary totals and weekly series for both resources, as pushed to live
+    dashboard subscribers.
+    """
+    return dashboard(db, username, sections=["summary", "by_week"])
@@ -0,0 +1,153 @@
+"""
+Archival of old logs.
+
+Logs dated more than ARCHIVE_AFTER_DAYS ago are moved from the hot
+water_logs/energy_logs tables into water_logs_archive/energy_logs_archive,
+and their per-day totals are added to archived_daily_usage. List and export
+endpoints read both tables through log_rows(); analytics read the daily
+totals, so archived periods cost one index range scan of aggregates.
+
+Each run raises the resource's archive_watermarks row to its cutoff before
+moving anything, holding the row lock until it commits; see
+archived_before().
+
+Run it periodically, e.g. from cron:
+
+    python -m app.archive --older-than-days 365
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, String, cast, delete, func, insert, literal, select, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import ArchivedDailyUsage, ArchiveWatermark, LOG_MODELS, ARCHIVE_MODELS
+from .queries import user_id_for
+
+# Columns shared by a hot table and its archive
+LOG_COLUMNS = {
+    "water": ["id", "user_id", "qty", "qty_litres", "unit", "category", "date", "created_at"],
+    "energy": ["id", "user_id", "qty", "unit", "date", "created_at"],
+}
+
+
+def archive_logs(db: Session, older_than_days: int) -> dict:
+    """
+    Move logs dated before today - older_than_days, or before an earlier
+    run's later cutoff, into the archive tables and fold them into
+    archived_daily_usage, in one transaction. Returns the number of rows
+    archived per resource.
+    """
+    cutoff = datetime.now().date() - timedelta(days=older_than_days)
+    archived_at = datetime.utcnow()
+    counts = {}
+
+    for resource, model in LOG_MODELS.items():
+        table = model.__table__
+        archive = ARCHIVE_MODELS[resource]
+        columns = LOG_COLUMNS[resource]
+
+        # The watermark never moves back, so neither does the cutoff
+        raise_watermark = pg_insert(ArchiveWatermark).values(resource=resource, archived_before=cutoff)
+        watermark = db.execute(
+            raise_watermark.on_conflict_do_update(
+                index_elements=["resource"],
+                set_={"archived_before": func.greatest(ArchiveWatermark.archived_before, raise_watermark.excluded.archived_before)},
+            ).returning(ArchiveWatermark.archived_before)
+        ).scalar()
+
+        # DELETE ... RETURNING feeds the INSERT, whose RETURNING feeds the
+        # daily totals, all in one statement: a log written with an old date
+        # mid-run is either moved and counted or left untouched, and the
+        # totals never read back from the archive table
+        moved = (
+            delete(table)
+            .where(table.c.date < watermark)
+            .returning(*[table.c[name] for name in columns])
+            .cte("moved")
+        )
+        if resource == "water":
+            total_column, group_column = "qty_litres", "category"
+        else:
+            total_column, group_column = "qty", None
+        archived = (
+            insert(archive)
+            .from_select(
+                columns + ["archived_at"],
+                select(*[moved.c[name] for name in columns], literal(archived_at, DateTime)),
+            )
+            .returning(archive.user_id, archive.date, getattr(archive, total_column), *([getattr(archive, group_column)] if group_column else []))
+            .cte("archived")
+        )
+
+        if group_column:
+            category, group_by = cast(archived.c[group_column], String), [archived.c[group_column]]
+        else:
+            category, group_by = literal(""), []
+        daily = (
+            select(archived.c.user_id, literal(resource), archived.c.date, category, func.sum(archived.c[total_column]))
+            .group_by(archived.c.user_id, archived.c.date, *group_by)
+        )
+        upsert = pg_insert(ArchivedDailyUsage).from_select(
+            ["user_id", "resource", "date", "category", "total"], daily
+        )
+        folded = upsert.on_conflict_do_update(
+            index_elements=["user_id", "resource", "date", "category"],
+            set_={"total": ArchivedDailyUsage.total + upsert.excluded.total},
+        ).cte("folded")
+        counts[resource] = db.execute(
+            select(func.count()).select_from(archived).add_cte(folded)
+        ).scalar()
+
+    db.commit()
+    return counts
+
+
+def archived_before(db: Session, resource: str):
+    """
+    The resource's archive watermark, or None if it has never been
+    archived. Takes the watermark row FOR SHARE, so a caller writing logs
+    dated on or after it either commits before an archive run moves them,
+    or waits for the run and sees its new watermark.
+    """
+    return db.execute(
+        select(ArchiveWatermark.archived_before)
+        .where(ArchiveWatermark.resource == resource)
+        .with_for_update(read=True)
+    ).scalar()
+
+
+def log_rows(resource: str, username: str):
+    """
+    A user's hot and archived logs of one resource as a single subquery
+    with the columns of the hot table.
+    """
+    model, archive = LOG_MODELS[resource], ARCHIVE_MODELS[resource]
+    columns = [name for name in LOG_COLUMNS[resource] if name != "user_id"]
+    user_id = user_id_for(username)
+    return union_all(
+        select(*[getattr(model, name) for name in columns]).where(model.user_id == user_id),
+        select(*[getattr(archive, name) for name in columns]).where(archive.user_id == user_id),
+    ).subquery()
+
+
+def main(argv=None):
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Move old logs into the archive tables.")
+    parser.add_argument("--older-than-days", type=int, default=settings.ARCHIVE_AFTER_DAYS)
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        counts = archive_logs(db, args.older_than_days)
+    finally:
+        db.close()
+    for resource, count in counts.items():
+        print(f"archived {count} {resource} logs")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer, HTTPAuthorizationCredentials, HTTPBearer
 from datetime import datetime, timedelta
+from typing import Optional
 from .config import settings
 from jose import JWTError, jwt
-from fastapi import HTTPException, status, Depends, Request
+from fastapi import HTTPException, status, Depends, Query, Request
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
@@ -91,6 +92,30 @@ def get_current_user(token: str = Depends(jwt_bearer_scheme)):
     return username
 
 
+optional_bearer_scheme = HTTPBearer(auto_error=False)
+# Dependency for Server-Sent Events routes: a browser's EventSource can't
+# set an Authorization header, so the token may also be passed as
+# ?access_token=. The header wins when both are present.
+def get_stream_user(
+    access_token: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer_scheme),
+):
+    if credentials is not None:
+        if credentials.scheme != "Bearer":
+            raise HTTPException(status_code=403, detail="Invalid authentication scheme.")
+        access_token = credentials.credentials
+    if not access_token:
+        raise HTTPException(status_code=403, detail="Not authenticated")
+    return verify_access_token(access_token)
+
+
+# Dependency restricting a route to the users listed in ADMIN_USERNAMES
+def get_admin_user(current_user: str = Depends(get_current_user)):
+    if current_user not in settings.ADMIN_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required.")
+    return current_user
+
+
 # Hash a password
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -0,0 +1,205 @@
+"""
+Usage budgets and alerts.
+
+Budgets are checked against the running totals app.rollups maintains, never
+against the logs: each write yields old -> new transitions of the affected
+period totals, and a budget fires when a transition crosses its limit. That
+is one indexed budget lookup per write, whatever the history size.
+
+Alerts are stored in budget_alerts (at most one per budget and period) and
+handed to the notifier after the write commits, from a background thread so
+a slow notifier never holds up a request. Alerts that could not be sent stay
+undelivered and can be retried with:
+
+    python -m app.budgets deliver
+"""
+import abc
+import argparse
+import importlib
+import logging
+import queue
+import threading
+from datetime import datetime
+
+from sqlalchemy import event, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import SessionLocal
+from .models import Budget, BudgetAlert
+
+logger = logging.getLogger(__name__)
+
+
+class Notifier(abc.ABC):
+    """
+    Delivers budget alerts. Subclass and point the BUDGET_NOTIFIER setting
+    at the class to send email, push notifications, webhooks, ...
+    """
+
+    @abc.abstractmethod
+    def send(self, alert: dict):
+        ...
+
+
+class LogNotifier(Notifier):
+    """
+    Default notifier: writes alerts to the application log.
+    """
+
+    def send(self, alert: dict):
+        logger.warning(
+            "Budget %(budget_id)s of user %(user_id)s exceeded: %(total).2f > %(limit_qty).2f "
+            "(%(resource)s, %(period)s from %(period_start)s)",
+            alert,
+        )
+
+
+_notifier = None
+
+
+def get_notifier() -> Notifier:
+    global _notifier
+    if _notifier is None:
+        module_name, _, class_name = settings.BUDGET_NOTIFIER.rpartition(".")
+        _notifier = getattr(importlib.import_module(module_name), class_name)()
+    return _notifier
+
+
+def check_budgets(db: Session, transitions):
+    """
+    Raise an alert for each budget whose limit one of the (key, old_total,
+    new_total) transitions crossed upwards. New alert ids are kept on the
+    session and queued for delivery when it commits.
+    """
+    rising = {key: (old, new) for key, old, new in transitions if new > old}
+    if not rising:
+        return
+
+    user_ids = {key[0] for key in rising}
+    budgets = db.execute(select(Budget).where(Budget.user_id.in_(user_ids))).scalars().all()
+    alerts = []
+    for budget in budgets:
+        for (user_id, resource, category, period, start), (old, new) in rising.items():
+            if (user_id, resource, category, period) != (budget.user_id, budget.resource, budget.category, budget.period):
+                continue
+            if old <= budget.limit_qty < new:
+                alerts.append({
+                    "budget_id": budget.id,
+                    "user_id": user_id,
+                    "period_start": start,
+                    "total": new,
+                    "limit_qty": budget.limit_qty,
+                    "created_at": datetime.utcnow(),
+                })
+    raise_alerts(db, alerts)
+
+
+def raise_alerts(db: Session, alerts: list):
+    if not alerts:
+        return
+    stmt = pg_insert(BudgetAlert).values(alerts).on_conflict_do_nothing(
+        index_elements=["budget_id", "period_start"]
+    ).returning(BudgetAlert.id)
+    ids = db.execute(stmt).scalars().all()
+    db.info.setdefault("budget_alerts", []).extend(ids)
+
+
+def deliver_alerts(db: Session, ids=None) -> int:
+    """
+    Send undelivered alerts (only those in ids, if given) through the
+    notifier and mark them delivered. Rows are claimed with SKIP LOCKED so
+    concurrent deliverers never send the same alert twice.
+    """
+    stmt = (
+        select(BudgetAlert, Budget)
+        .join(Budget, Budget.id == BudgetAlert.budget_id)
+        .where(BudgetAlert.delivered_at.is_(None))
+        .with_for_update(of=BudgetAlert, skip_locked=True)
+    )
+    if ids is not None:
+        stmt = stmt.where(BudgetAlert.id.in_(ids))
+
+    delivered = []
+    for alert, budget in db.execute(stmt).all():
+        try:
+            get_notifier().send({
+                "id": alert.id,
+                "budget_id": budget.id,
+                "user_id": alert.user_id,
+                "resource": budget.resource,
+                "category": budget.category,
+                "period": budget.period,
+                "period_start": alert.period_start,
+                "total": alert.total,
+                "limit_qty": alert.limit_qty,
+            })
+            delivered.append(alert.id)
+        except Exception:
+            logger.exception("Failed to deliver budget alert %s", alert.id)
+    if delivered:
+        db.execute(
+            update(BudgetAlert).where(BudgetAlert.id.in_(delivered)).values(delivered_at=datetime.utcnow())
+        )
+    db.commit()
+    return len(delivered)
+
+
+_pending = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _deliver_forever():
+    while True:
+        ids = [_pending.get()]
+        while not _pending.empty():
+            ids.append(_pending.get_nowait())
+        db = SessionLocal()
+        try:
+            deliver_alerts(db, ids)
+        except Exception:
+            logger.exception("Budget alert delivery failed")
+        finally:
+            db.close()
+
+
+def _enqueue(ids):
+    global _worker
+    # Started lazily, so each (possibly forked) worker process gets its own
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_deliver_forever, name="budget-alerts", daemon=True)
+            _worker.start()
+    for alert_id in ids:
+        _pending.put(alert_id)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _queue_committed_alerts(session):
+    ids = session.info.pop("budget_alerts", None)
+    if ids:
+        _enqueue(ids)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _drop_rolled_back_alerts(session):
+    session.info.pop("budget_alerts", None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Budget alert maintenance.")
+    parser.add_argument("command", choices=["deliver"])
+    parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        count = deliver_alerts(db)
+    finally:
+        db.close()
+    print(f"delivered {count} budget alerts")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,26 @@ class Settings(BaseSettings):
     ALGORITHM:str = 'HS256'
     BACKEND_CORS_ORIGINS: List[str] = ['http://localhost:5173','https://personal-resource-tracker-app.onrender.com']
     TIME_ZONE:str = 'Africa/Lagos'
+    EVENT_BROKER:str = 'app.events.LocalBroker'
+    LIVE_HEARTBEAT_SECONDS:int = 15
+    ARCHIVE_AFTER_DAYS:int = 365
+    METER_MAX_BATCH:int = 10000
+    BUDGET_NOTIFIER:str = 'app.budgets.LogNotifier'
+    RATE_LIMIT_STORE:str = 'app.ratelimit.MemoryStore'
+    RATE_LIMIT_MAX_KEYS:int = 100000
+    AUTH_RATE_LIMIT_IP:str = '20/minute'
+    AUTH_RATE_LIMIT_USERNAME:str = '5/minute'
+    ADMIN_USERNAMES: List[str] = []
+    PROFILING_ENABLED:bool = False
+    PROFILE_SAMPLE_INTERVAL:float = 0.005
+    HOST:str = '0.0.0.0'
+    PORT:int = 8001
+    # Number of server workers; 0 means one per available CPU
+    WEB_CONCURRENCY:int = 0
+    SERVER_LOOP:str = 'auto'
+    SERVER_HTTP:str = 'auto'
+    SHUTDOWN_TIMEOUT:int = 30
+    FORWARDED_ALLOW_IPS:str = '127.0.0.1'
     model_config = SettingsConfigDict(env_file=".env", case_sensitive=True)
 
 
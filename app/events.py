@@ -0,0 +1,244 @@
+import asyncio
+import importlib
+import json
+import logging
+import select
+import signal
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import func
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    Receiving end of a channel subscription. Messages are coalesced: if the
+    consumer hasn't picked up the previous one yet, newer messages replace it,
+    so a slow client only ever sees the latest change.
+    """
+
+    def __init__(self, broker: "Broker", channel: str):
+        self.broker = broker
+        self.channel = channel
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=1)
+
+    def _offer(self, message: dict):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(message)
+
+    def deliver(self, message: dict):
+        # May be called from a worker thread (sync endpoints run in a threadpool)
+        self._loop.call_soon_threadsafe(self._offer, message)
+
+    async def get(self, timeout: float = None) -> dict:
+        """
+        Wait for the next message; returns None if the timeout expires first.
+        """
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """
+    In-process pub/sub. Subscriptions live in the worker that accepted the
+    connection; publish() hands a message to every local subscriber of the
+    channel.
+
+    To fan out across workers, subclass and override publish() to send the
+    message to a shared bus (Redis, Postgres LISTEN/NOTIFY, ...), and call
+    deliver() from the bus listener in every worker. Select the class with
+    the EVENT_BROKER setting.
+    """
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel: str) -> Subscription:
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.channel]
+
+    def wake_all(self, message: dict = None):
+        """
+        Deliver message (by default an empty one) to every subscriber.
+        """
+        with self._lock:
+            subscribers = [subscription for channel in self._subscriptions.values() for subscription in channel]
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+    def deliver(self, channel: str, message: dict):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+    def publish(self, channel: str, message: dict):
+        self.deliver(channel, message)
+
+
+class LocalBroker(Broker):
+    """
+    Single-process broker; the default, and a stand-in for a shared broker
+    in development and tests. Only reaches subscribers on the worker that
+    handled the write, so run a single worker with it.
+    """
+
+
+class PostgresBroker(Broker):
+    """
+    Fans messages out to every worker and host through Postgres
+    LISTEN/NOTIFY. publish() sends a NOTIFY on PG_CHANNEL; each worker runs
+    one listener thread, started with its first subscription, on a
+    dedicated psycopg2 connection and delivers what it hears to its local
+    subscribers. If the connection drops, the listener reconnects and wakes
+    every subscriber with a "resync" message, since notifications sent in
+    between are lost.
+    """
+    PG_CHANNEL = "log_changes"
+    RECONNECT_SECONDS = 5
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, channel: str) -> Subscription:
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="event-listener", daemon=True)
+                self._listener.start()
+        return super().subscribe(channel)
+
+    def publish(self, channel: str, message: dict):
+        from .database import engine
+
+        payload = json.dumps({"channel": channel, "message": message})
+        with engine.begin() as connection:
+            connection.execute(func.pg_notify(self.PG_CHANNEL, payload).select())
+
+    def _listen(self):
+        from .database import engine
+
+        reconnecting = False
+        while True:
+            connection = None
+            try:
+                connection = engine.raw_connection()
+                driver_connection = connection.driver_connection
+                driver_connection.autocommit = True
+                with driver_connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.PG_CHANNEL}")
+                if reconnecting:
+                    self.wake_all({"resync": True})
+                while True:
+                    if select.select([driver_connection], [], [], self.RECONNECT_SECONDS) == ([], [], []):
+                        continue
+                    driver_connection.poll()
+                    while driver_connection.notifies:
+                        notify = driver_connection.notifies.pop(0)
+                        event = json.loads(notify.payload)
+                        self.deliver(event["channel"], event["message"])
+            except Exception:
+                logger.exception("Event listener lost its database connection, reconnecting")
+            finally:
+                if connection is not None:
+                    connection.invalidate()
+            reconnecting = True
+            time.sleep(self.RECONNECT_SECONDS)
+
+
+_broker = None
+_shutting_down = threading.Event()
+
+
+def broker_class() -> type:
+    module_name, _, class_name = settings.EVENT_BROKER.rpartition(".")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def get_broker() -> Broker:
+    global _broker
+    if _broker is None:
+        _broker = broker_class()()
+    return _broker
+
+
+def shutting_down() -> bool:
+    return _shutting_down.is_set()
+
+
+def begin_shutdown():
+    """
+    Called as the server starts shutting down: wakes every subscription so
+    live streams end instead of holding the worker's graceful shutdown open
+    until SHUTDOWN_TIMEOUT.
+    """
+    _shutting_down.set()
+    if _broker is not None:
+        _broker.wake_all()
+
+
+def install_shutdown_handlers():
+    """
+    Chain begin_shutdown() in front of the server's SIGINT/SIGTERM handlers.
+    uvicorn only runs the lifespan shutdown after open connections have
+    closed, which live streams never do on their own, so streams have to be
+    told when the signal arrives. Call from the lifespan startup: uvicorn
+    (0.34, pinned in requirements.txt) installs its handlers before it, and
+    restores the previous ones when it exits. Does nothing off the main
+    thread, where signals can't be handled (e.g. under TestClient).
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        server_handler = signal.getsignal(sig)
+        if not callable(server_handler):
+            continue
+
+        def handler(signum, frame, server_handler=server_handler):
+            # Signal handlers can interrupt the loop while it holds the
+            # broker's lock, so the wake-up is scheduled on the loop
+            loop.call_soon_threadsafe(begin_shutdown)
+            server_handler(signum, frame)
+
+        signal.signal(sig, handler)
+
+
+def user_channel(username: str) -> str:
+    return f"user:{username}"
+
+
+def notify_logs_changed(username: str, resource: str):
+    """
+    Tell live subscribers that a user's logs changed. Called by the write
+    handlers after commit; failures are logged, never raised, so a broker
+    outage can't fail a write that already succeeded.
+    """
+    try:
+        get_broker().publish(user_channel(username), {"resource": resource})
+    except Exception:
+        logger.exception("Failed to publish log change for %s", username)
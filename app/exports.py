@@ -0,0 +1,25 @@
+from io import BytesIO
+from typing import List
+
+from fastapi.responses import StreamingResponse
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def excel_response(rows: List[dict], filename: str) -> StreamingResponse:
+    """
+    Render a list of row dicts as an xlsx download.
+    pandas (and numpy/openpyxl with it) is imported on first export rather
+    than at module load, so workers that never export don't pay for it.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(rows)
+
+    excel_file = BytesIO()
+    df.to_excel(excel_file, index=False, engine="openpyxl")
+    excel_file.seek(0)
+
+    return StreamingResponse(
+        excel_file, media_type=XLSX_MEDIA_TYPE, headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
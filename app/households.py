@@ -0,0 +1,272 @@
+"""
+Household groups.
+
+Household views read household_usage_totals, the members' usage_totals
+summed per household. It's maintained like the per-user totals: every
+member's log write adds its deltas to the household's totals too (one
+membership lookup and one upsert per write), and joining or leaving adds
+or subtracts the member's whole usage_totals in one statement. A household
+dashboard is therefore as cheap as an individual one, whatever the number
+of members.
+
+Writes take a FOR SHARE lock on the writer's users row before reading the
+membership, and joins/leaves take FOR NO KEY UPDATE on it, so a write can't
+slip between a membership change and the transfer of the member's totals.
+"""
+import calendar
+import secrets
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, delete, func, insert, literal, or_, select, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .analytics import DAY_NAMES, DASHBOARD_SECTIONS, usage_summary
+from .models import Household, HouseholdMember, HouseholdUsageTotal, UsageTotal, User, WaterCategory, LOG_MODELS, ARCHIVE_MODELS
+
+TOTAL_KEY = ["household_id", "resource", "category", "period", "period_start"]
+
+
+def update_household_totals(db: Session, transitions):
+    """
+    Add the movements of per-user totals, as (key, old_total, new_total)
+    from app.rollups.record_usage_changes, to the totals of the users'
+    households.
+    """
+    user_ids = sorted({key[0] for key, _, _ in transitions})
+    if not user_ids:
+        return
+    db.execute(select(User.id).where(User.id.in_(user_ids)).order_by(User.id).with_for_update(read=True))
+    households = dict(db.execute(
+        select(HouseholdMember.user_id, HouseholdMember.household_id).where(HouseholdMember.user_id.in_(user_ids))
+    ).all())
+    if not households:
+        return
+
+    changes = defaultdict(float)
+    for (user_id, resource, category, period, start), old, new in transitions:
+        if user_id in households:
+            changes[(households[user_id], resource, category, period, start)] += new - old
+    # Sorted so concurrent writers lock total rows in the same order
+    keys = sorted(changes)
+    stmt = pg_insert(HouseholdUsageTotal).values([dict(zip(TOTAL_KEY, key), total=changes[key]) for key in keys])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=TOTAL_KEY,
+        set_={"total": HouseholdUsageTotal.total + stmt.excluded.total},
+    ))
+
+
+def transfer_member_totals(db: Session, household_id: int, user_id: int, sign: int):
+    """
+    Add (sign=1) or subtract (sign=-1) all of a user's usage_totals to the
+    household's, in one INSERT ... SELECT. Ordered by the conflict key so
+    it locks total rows in the same order as update_household_totals().
+    """
+    member_totals = select(
+        literal(household_id), UsageTotal.resource, UsageTotal.category, UsageTotal.period, UsageTotal.period_start,
+        sign * UsageTotal.total,
+    ).where(UsageTotal.user_id == user_id).order_by(
+        # Byte order, as Python sorts the keys there
+        UsageTotal.resource.collate("C"), UsageTotal.category.collate("C"), UsageTotal.period.collate("C"), UsageTotal.period_start,
+    )
+    stmt = pg_insert(HouseholdUsageTotal).from_select(TOTAL_KEY + ["total"], member_totals)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=TOTAL_KEY,
+        set_={"total": HouseholdUsageTotal.total + stmt.excluded.total},
+    ))
+
+
+def lock_user(db: Session, user_id: int):
+    # Waits for the user's in-flight log writes (see the module docstring)
+    db.execute(select(User.id).where(User.id == user_id).with_for_update(key_share=True))
+
+
+def membership(db: Session, user_id: int):
+    return db.execute(select(HouseholdMember).where(HouseholdMember.user_id == user_id)).scalar()
+
+
+def create_household(db: Session, user_id: int, name: str) -> Household:
+    """
+    Create a household with the user as its owner. The caller commits.
+    """
+    household = Household(name=name, invite_code=secrets.token_urlsafe(9), created_at=datetime.utcnow())
+    db.add(household)
+    db.flush()
+    add_member(db, household.id, user_id, "owner")
+    return household
+
+
+def add_member(db: Session, household_id: int, user_id: int, role: str = "member"):
+    lock_user(db, user_id)
+    if membership(db, user_id) is not None:
+        raise ValueError("You already belong to a household.")
+    db.add(HouseholdMember(household_id=household_id, user_id=user_id, role=role, joined_at=datetime.utcnow()))
+    db.flush()
+    transfer_member_totals(db, household_id, user_id, 1)
+
+
+def remove_member(db: Session, household_id: int, user_id: int):
+    """
+    Take a user out of a household along with their usage. The last member
+    leaving deletes the household; an owner leaving hands ownership to the
+    longest-standing remaining member.
+    """
+    lock_user(db, user_id)
+    member = db.execute(
+        delete(HouseholdMember)
+        .where(HouseholdMember.household_id == household_id, HouseholdMember.user_id == user_id)
+        .returning(HouseholdMember.role)
+    ).first()
+    if member is None:
+        raise LookupError("Member not found.")
+    transfer_member_totals(db, household_id, user_id, -1)
+
+    remaining = db.execute(
+        select(HouseholdMember)
+        .where(HouseholdMember.household_id == household_id)
+        .order_by(HouseholdMember.joined_at, HouseholdMember.user_id)
+    ).scalars().all()
+    if not remaining:
+        db.execute(delete(Household).where(Household.id == household_id))
+    elif member.role == "owner" and not any(m.role == "owner" for m in remaining):
+        remaining[0].role = "owner"
+
+
+def household_totals(db: Session, household_id: int, resources, today: date, pie: bool = False) -> dict:
+    """
+    The household totals a dashboard needs, in one query: the days of this
+    week and month, the current week, and this year's months, plus the
+    water categories of the current week and month with pie. Returns
+    {(resource, category, period, period_start): total}.
+    """
+    start_of_week = today - timedelta(days=today.weekday())
+    first_day = min(start_of_week, today.replace(day=1))
+    windows = [
+        and_(HouseholdUsageTotal.period == "day", HouseholdUsageTotal.period_start.between(first_day, start_of_week + timedelta(days=6))),
+        and_(HouseholdUsageTotal.period == "week", HouseholdUsageTotal.period_start == start_of_week),
+        and_(HouseholdUsageTotal.period == "month", HouseholdUsageTotal.period_start >= today.replace(month=1, day=1), HouseholdUsageTotal.period_start <= today.replace(month=12, day=1)),
+    ]
+    categories = [HouseholdUsageTotal.category == ""]
+    if pie:
+        categories.append(and_(HouseholdUsageTotal.resource == "water", HouseholdUsageTotal.period.in_(["week", "month"])))
+    rows = db.execute(
+        select(HouseholdUsageTotal.resource, HouseholdUsageTotal.category, HouseholdUsageTotal.period, HouseholdUsageTotal.period_start, HouseholdUsageTotal.total)
+        .where(HouseholdUsageTotal.household_id == household_id, HouseholdUsageTotal.resource.in_(resources), or_(*windows), or_(*categories))
+    ).all()
+    return {(row.resource, row.category, row.period, row.period_start): row.total for row in rows}
+
+
+def household_dashboard(db: Session, household_id: int, resources=("water", "energy"), sections=DASHBOARD_SECTIONS, pie: bool = False) -> dict:
+    """
+    The /general/dashboard views for a whole household, from its rollups.
+    """
+    today = datetime.now().date()
+    start_of_week = today - timedelta(days=today.weekday())
+    start_of_month = today.replace(day=1)
+    totals = household_totals(db, household_id, resources, today, pie=pie)
+
+    result = {}
+    for resource in resources:
+        def total(period, start, category=""):
+            return totals.get((resource, category, period, start), 0)
+
+        views = {}
+        if "summary" in sections:
+            # From the day totals, so logs dated later this week or month
+            # aren't counted, as in the per-user summary
+            daily = {start: qty for (res, category, period, start), qty in totals.items() if res == resource and category == "" and period == "day"}
+            views["summary"] = usage_summary(daily, today)
+        if "by_week" in sections:
+            views["by_week"] = [
+                {"name": name, "qty": total("day", start_of_week + timedelta(days=offset))}
+                for offset, name in enumerate(DAY_NAMES)
+            ]
+        if "by_month" in sections:
+            views["by_month"] = [
+                {"name": calendar.month_name[month][:3], "qty": total("month", today.replace(month=month, day=1))}
+                for month in range(1, 13)
+            ]
+        if pie and resource == "water":
+            for view, period, start in [("pie_week", "week", start_of_week), ("pie_month", "month", start_of_month)]:
+                views[view] = [
+                    {"category": category, "total_qty": total(period, start, category.name)}
+                    for category in WaterCategory
+                    if total(period, start, category.name)
+                ]
+        result[resource] = views
+    return result
+
+
+def member_breakdown(db: Session, household_id: int) -> list:
+    """
+    Each member's usage for today, this week and this month, summed from
+    their day totals up to today in one query.
+    """
+    today = datetime.now().date()
+    start_of_week = today - timedelta(days=today.weekday())
+    start_of_month = today.replace(day=1)
+    days = and_(
+        UsageTotal.user_id == HouseholdMember.user_id,
+        UsageTotal.category == "",
+        UsageTotal.period == "day",
+        UsageTotal.period_start.between(min(start_of_week, start_of_month), today),
+    )
+    rows = db.execute(
+        select(
+            User.username,
+            HouseholdMember.role,
+            UsageTotal.resource,
+            func.sum(UsageTotal.total).filter(UsageTotal.period_start == today).label("today"),
+            func.sum(UsageTotal.total).filter(UsageTotal.period_start >= start_of_week).label("this_week"),
+            func.sum(UsageTotal.total).filter(UsageTotal.period_start >= start_of_month).label("this_month"),
+        )
+        .join(User, User.id == HouseholdMember.user_id)
+        .outerjoin(UsageTotal, days)
+        .where(HouseholdMember.household_id == household_id)
+        .group_by(User.username, HouseholdMember.role, HouseholdMember.joined_at, UsageTotal.resource)
+        .order_by(HouseholdMember.joined_at, User.username)
+    ).all()
+
+    names = ["today", "this_week", "this_month"]
+    members = {}
+    for row in rows:
+        member = members.setdefault(row.username, {
+            "username": row.username,
+            "role": row.role,
+            **{resource: {name: 0 for name in names} for resource in LOG_MODELS},
+        })
+        if row.resource is not None:
+            member[row.resource] = {name: getattr(row, name) or 0 for name in names}
+    return list(members.values())
+
+
+def household_log_rows(resource: str, household_id: int, columns):
+    """
+    The hot and archived logs of every member of a household as a single
+    subquery with the given columns plus the member's username.
+    """
+    model, archive = LOG_MODELS[resource], ARCHIVE_MODELS[resource]
+    selects = []
+    for table in (model, archive):
+        selects.append(
+            select(User.username, *[getattr(table, name) for name in columns])
+            .join(HouseholdMember, HouseholdMember.user_id == table.user_id)
+            .join(User, User.id == table.user_id)
+            .where(HouseholdMember.household_id == household_id)
+        )
+    return union_all(*selects).subquery()
+
+
+def rebuild_household_totals(db: Session):
+    """
+    Recompute household_usage_totals from usage_totals. Runs in the caller's
+    transaction.
+    """
+    db.execute(delete(HouseholdUsageTotal))
+    db.execute(insert(HouseholdUsageTotal).from_select(
+        TOTAL_KEY + ["total"],
+        select(HouseholdMember.household_id, UsageTotal.resource, UsageTotal.category, UsageTotal.period, UsageTotal.period_start, func.sum(UsageTotal.total))
+        .join(UsageTotal, UsageTotal.user_id == HouseholdMember.user_id)
+        .group_by(HouseholdMember.household_id, UsageTotal.resource, UsageTotal.category, UsageTotal.period, UsageTotal.period_start),
+    ))
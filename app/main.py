@@ -1,19 +1,28 @@
+from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI
-from .router import auth, water_logs, energy_logs, general
+from .router import auth, water_logs, energy_logs, general, live, sync, meter_readings, budgets, households, admin, health
 from .config import settings
+from .events import install_shutdown_handlers
 from fastapi.middleware.cors import CORSMiddleware
 
 BASE_PATH = Path(__file__).resolve().parent
 
-app = FastAPI(title="Personal Resource Tracker API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Ends live streams as soon as the server is told to stop
+    install_shutdown_handlers()
+    yield
+
+
+app = FastAPI(title="Personal Resource Tracker API", lifespan=lifespan)
 
 if settings.BACKEND_CORS_ORIGINS:
     app.add_middleware(
         CORSMiddleware,
         allow_origins=settings.BACKEND_CORS_ORIGINS,
         allow_credentials=True,
-        allow_methods=["GET", "POST", "PUT", "DELETE"],
+        allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
         allow_headers=["*"],
     )
 
@@ -22,7 +31,14 @@ if settings.BACKEND_CORS_ORIGINS:
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(water_logs.router, prefix="/water-logs", tags=["Water Logs"])
 app.include_router(energy_logs.router, prefix="/energy-logs", tags=["Energy Logs"])
+app.include_router(meter_readings.router, prefix="/meter-readings", tags=["Meter Readings"])
 app.include_router(general.router, prefix="/general", tags=["General Logs"])
+app.include_router(budgets.router, prefix="/budgets", tags=["Budgets"])
+app.include_router(households.router, prefix="/households", tags=["Households"])
+app.include_router(live.router, prefix="/live", tags=["Live"])
+app.include_router(sync.router, prefix="/sync", tags=["Sync"])
+app.include_router(admin.router, prefix="/admin", tags=["Admin"])
+app.include_router(health.router, prefix="/health", tags=["Health"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,189 @@
+"""
+Smart-meter readings.
+
+Devices report cumulative kWh counters. Raw readings go into meter_readings;
+each ingested batch then recomputes the hourly usage (meter_hourly_usage)
+and the per-day EnergyLog rows for the span of time it touched, so the
+existing energy endpoints include metered usage without reading raw points.
+
+Usage between two consecutive readings is attributed to the hour of the
+later one. A reading lower than its predecessor is treated as a counter
+reset, contributing its own value.
+"""
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import DateTime, case, func, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .archive import archived_before
+from .config import settings
+from .models import EnergyLog, EnergyUnit, MeterDevice, MeterHourlyUsage, MeterReading, log_change_seq
+from .rollups import record_usage_changes
+from .sync import lock_log_changes
+
+
+def get_or_create_device(db: Session, user_id: int, name: str) -> int:
+    """
+    Id of the user's device called name, registering it on first use.
+    """
+    stmt = pg_insert(MeterDevice).values(user_id=user_id, name=name, created_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "name"], set_={"name": stmt.excluded.name}
+    ).returning(MeterDevice.id)
+    return db.execute(stmt).scalar_one()
+
+
+def as_utc(ts: datetime) -> datetime:
+    # Readings without an offset are taken to be UTC
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+
+def ingest_readings(db: Session, user_id: int, device_id: int, readings) -> int:
+    """
+    Store a batch of (timestamp, cumulative kWh) readings and bring the
+    hourly and daily rollups up to date. Duplicate timestamps are ignored.
+    Returns the number of new readings; the caller commits.
+
+    Takes lock_log_changes() before anything else, so a user's ingests run
+    one at a time and each recomputes its rollups from committed readings
+    and totals, not ones a concurrent batch is about to replace.
+    """
+    rows = [{"device_id": device_id, "ts": as_utc(ts), "reading_kwh": kwh} for ts, kwh in readings]
+    if not rows:
+        return 0
+    lock_log_changes(db, user_id)
+    inserted = db.execute(
+        pg_insert(MeterReading).on_conflict_do_nothing().returning(MeterReading.ts),
+        rows,
+    ).scalars().all()
+    if inserted:
+        refresh_rollups(db, user_id, device_id, min(inserted), max(inserted))
+    return len(inserted)
+
+
+def refresh_rollups(db: Session, user_id: int, device_id: int, first: datetime, last: datetime):
+    """
+    Recompute hourly usage from the hour of `first` up to the hour of the
+    reading following `last` (whose delta the new readings changed), then
+    the daily EnergyLog totals for the days those hours fall on.
+    """
+    following = db.execute(
+        select(func.min(MeterReading.ts)).where(MeterReading.device_id == device_id, MeterReading.ts > last)
+    ).scalar()
+    start = first.replace(minute=0, second=0, microsecond=0)
+    end = (following or last).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+    # Include the last reading before the window so the first delta is right
+    previous = (
+        select(func.coalesce(func.max(MeterReading.ts), literal(start, DateTime(timezone=True))))
+        .where(MeterReading.device_id == device_id, MeterReading.ts < start)
+        .scalar_subquery()
+    )
+    prev_kwh = func.lag(MeterReading.reading_kwh).over(order_by=MeterReading.ts)
+    window = (
+        select(MeterReading.ts, MeterReading.reading_kwh, prev_kwh.label("prev_kwh"))
+        .where(MeterReading.device_id == device_id, MeterReading.ts >= previous, MeterReading.ts < end)
+        .subquery()
+    )
+    delta = case(
+        (window.c.prev_kwh.is_(None), 0.0),
+        (window.c.reading_kwh >= window.c.prev_kwh, window.c.reading_kwh - window.c.prev_kwh),
+        else_=window.c.reading_kwh,
+    )
+    hour = func.date_trunc("hour", window.c.ts)
+    hourly = (
+        select(literal(device_id).label("device_id"), hour.label("hour"), func.sum(delta).label("kwh"))
+        .where(window.c.ts >= start)
+        .group_by(hour)
+    )
+    upsert = pg_insert(MeterHourlyUsage).from_select(["device_id", "hour", "kwh"], hourly)
+    db.execute(upsert.on_conflict_do_update(
+        index_elements=["device_id", "hour"], set_={"kwh": upsert.excluded.kwh}
+    ))
+
+    refresh_daily_logs(db, user_id, device_id, start, end)
+
+
+def refresh_daily_logs(db: Session, user_id: int, device_id: int, start: datetime, end: datetime):
+    """
+    Upsert one EnergyLog per local day (settings.TIME_ZONE) between start
+    and end with that day's metered kWh. Days before the archive watermark
+    are left alone, since their totals already live in the archive.
+    Callers hold lock_log_changes() for the user.
+    """
+    tz = ZoneInfo(settings.TIME_ZONE)
+    first_day = start.astimezone(tz).date()
+    watermark = archived_before(db, "energy")
+    if watermark is not None:
+        first_day = max(first_day, watermark)
+    last_day = (end - timedelta(microseconds=1)).astimezone(tz).date()
+    if first_day > last_day:
+        return
+
+    day_start = datetime.combine(first_day, datetime.min.time(), tz)
+    day_end = datetime.combine(last_day + timedelta(days=1), datetime.min.time(), tz)
+    local_day = func.date(func.timezone(settings.TIME_ZONE, MeterHourlyUsage.hour))
+    totals = db.execute(
+        select(local_day, func.sum(MeterHourlyUsage.kwh))
+        .where(MeterHourlyUsage.device_id == device_id, MeterHourlyUsage.hour >= day_start, MeterHourlyUsage.hour < day_end)
+        .group_by(local_day)
+    ).all()
+    if not totals:
+        return
+
+    previous = dict(db.execute(
+        select(EnergyLog.date, EnergyLog.qty)
+        .where(EnergyLog.meter_device_id == device_id, EnergyLog.date.in_([day for day, _ in totals]))
+        .with_for_update()
+    ).all())
+    upsert = pg_insert(EnergyLog).values([
+        {
+            "user_id": user_id,
+            "meter_device_id": device_id,
+            "date": day,
+            "qty": kwh,
+            "unit": EnergyUnit.KWH,
+            "created_at": datetime.today(),
+            "updated_at": datetime.utcnow(),
+            "change_seq": log_change_seq.next_value(),
+        }
+        for day, kwh in totals
+    ])
+    db.execute(upsert.on_conflict_do_update(
+        index_elements=["meter_device_id", "date"],
+        set_={"qty": upsert.excluded.qty, "updated_at": upsert.excluded.updated_at, "change_seq": log_change_seq.next_value()},
+    ))
+    record_usage_changes(db, "energy", [(user_id, day, None, kwh - (previous.get(day) or 0)) for day, kwh in totals])
+
+
+def usage_series(db: Session, device_id: int, start: datetime, end: datetime, resolution: str, limit: int) -> list:
+    """
+    Readings or usage for a device between start and end. "raw" returns the
+    cumulative readings themselves; "hour" and "day" return kWh consumed per
+    bucket from the hourly rollup, days being local to settings.TIME_ZONE.
+    Every variant is a range scan on a (device, time) primary key.
+    """
+    start, end = as_utc(start), as_utc(end)
+    if resolution == "raw":
+        rows = db.execute(
+            select(MeterReading.ts, MeterReading.reading_kwh)
+            .where(MeterReading.device_id == device_id, MeterReading.ts >= start, MeterReading.ts < end)
+            .order_by(MeterReading.ts)
+            .limit(limit)
+        ).all()
+        return [{"ts": ts, "reading_kwh": kwh} for ts, kwh in rows]
+
+    if resolution == "hour":
+        bucket = MeterHourlyUsage.hour
+    else:
+        bucket = func.date(func.timezone(settings.TIME_ZONE, MeterHourlyUsage.hour))
+    rows = db.execute(
+        select(bucket.label("bucket"), func.sum(MeterHourlyUsage.kwh))
+        .where(MeterHourlyUsage.device_id == device_id, MeterHourlyUsage.hour >= start, MeterHourlyUsage.hour < end)
+        .group_by(bucket)
+        .order_by(bucket)
+        .limit(limit)
+    ).all()
+    return [{"ts": ts, "kwh": kwh} for ts, kwh in rows]
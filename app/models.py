@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Enum, BigInteger, DateTime, Sequence, Index, PrimaryKeyConstraint
 from .database import Base
 import enum
 from datetime import datetime
@@ -16,9 +16,23 @@ class WaterCategory(enum.Enum):
     COOKING = "cooking"
     OTHER = "other"
 
+# Litres per unit, used to keep WaterLog.qty_litres in step with qty/unit
+WATER_UNIT_LITRES = {
+    WaterUnit.LITRE: 1,
+    WaterUnit.BUCKET: 19,
+    WaterUnit.CUP: 0.236,
+}
+
 class EnergyUnit(enum.Enum):
     KWH = "kwh"
 
+# Shared, monotonically increasing change counter. Every insert/update of a
+# log and every tombstone takes the next value, so "everything since N" is
+# an index range scan per table. The server default also numbers rows that
+# exist when the column is added.
+log_change_seq = Sequence("log_change_seq", metadata=Base.metadata)
+
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -42,7 +56,10 @@ class WaterLog(Base):
     category = Column(Enum(WaterCategory), nullable=False)
     date = Column(Date)
     created_at = Column(Date, default=datetime.today())
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = Column(BigInteger, log_change_seq, server_default=log_change_seq.next_value(), onupdate=log_change_seq.next_value(), nullable=False)
     user = relationship("User", back_populates="water_logs")
+    __table_args__ = (Index("ix_water_logs_user_change_seq", "user_id", "change_seq"),)
 
 class EnergyLog(Base):
     __tablename__ = "energy_logs"
@@ -52,4 +69,260 @@ class EnergyLog(Base):
     unit = Column(Enum(EnergyUnit), nullable=False)
     date = Column(Date)
     created_at = Column(Date, default=datetime.today())
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = Column(BigInteger, log_change_seq, server_default=log_change_seq.next_value(), onupdate=log_change_seq.next_value(), nullable=False)
+    # Set on the daily totals written by meter downsampling (app.meters)
+    meter_device_id = Column(Integer, ForeignKey("meter_devices.id"), nullable=True)
     user = relationship("User", back_populates="energy_logs")
+    __table_args__ = (
+        Index("ix_energy_logs_user_change_seq", "user_id", "change_seq"),
+        Index("ix_energy_logs_meter_device_date", "meter_device_id", "date", unique=True),
+    )
+
+
+class LogTombstone(Base):
+    """
+    Marker left behind when a log is deleted, so sync clients can drop it.
+    """
+    __tablename__ = "log_tombstones"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    resource = Column(String, nullable=False)
+    log_id = Column(Integer, nullable=False)
+    change_seq = Column(BigInteger, log_change_seq, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_log_tombstones_user_change_seq", "user_id", "change_seq"),)
+
+
+class WaterLogArchive(Base):
+    """
+    Water logs moved out of water_logs by the archival job (app.archive).
+    Rows keep their original id.
+    """
+    __tablename__ = "water_logs_archive"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    qty = Column(Float)
+    qty_litres = Column(Float)
+    unit = Column(Enum(WaterUnit), nullable=False)
+    category = Column(Enum(WaterCategory), nullable=False)
+    date = Column(Date)
+    created_at = Column(Date)
+    archived_at = Column(DateTime, nullable=False)
+    __table_args__ = (Index("ix_water_logs_archive_user_date", "user_id", "date"),)
+
+
+class EnergyLogArchive(Base):
+    """
+    Energy logs moved out of energy_logs by the archival job (app.archive).
+    Rows keep their original id.
+    """
+    __tablename__ = "energy_logs_archive"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    qty = Column(Float)
+    unit = Column(Enum(EnergyUnit), nullable=False)
+    date = Column(Date)
+    created_at = Column(Date)
+    archived_at = Column(DateTime, nullable=False)
+    __table_args__ = (Index("ix_energy_logs_archive_user_date", "user_id", "date"),)
+
+
+class ArchivedDailyUsage(Base):
+    """
+    Per-day totals of archived logs, so analytics over archived periods
+    don't have to scan the archive tables. category holds the WaterCategory
+    member name for water and "" for energy.
+    """
+    __tablename__ = "archived_daily_usage"
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    resource = Column(String, nullable=False)
+    date = Column(Date, nullable=False)
+    category = Column(String, nullable=False, default="")
+    total = Column(Float, nullable=False)
+    __table_args__ = (PrimaryKeyConstraint("user_id", "resource", "date", "category"),)
+
+
+class ArchiveWatermark(Base):
+    """
+    Per resource, the date before which every log has been moved to the
+    archive. Writers that must not create hot logs for archived days (the
+    meter daily logs) check it instead of computing their own cutoff.
+    """
+    __tablename__ = "archive_watermarks"
+    resource = Column(String, primary_key=True)
+    archived_before = Column(Date, nullable=False)
+
+
+
+class MeterDevice(Base):
+    """
+    A smart plug or meter reporting cumulative kWh readings for a user.
+    """
+    __tablename__ = "meter_devices"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    name = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_meter_devices_user_name", "user_id", "name", unique=True),)
+
+
+class MeterReading(Base):
+    """
+    Raw cumulative reading. Kept narrow (int, timestamp, double) with the
+    primary key doubling as the (device, time) range index.
+    """
+    __tablename__ = "meter_readings"
+    device_id = Column(Integer, ForeignKey("meter_devices.id"), nullable=False)
+    ts = Column(DateTime(timezone=True), nullable=False)
+    reading_kwh = Column(Float, nullable=False)
+    __table_args__ = (PrimaryKeyConstraint("device_id", "ts"),)
+
+
+class MeterHourlyUsage(Base):
+    """
+    kWh consumed per device per hour, derived from consecutive readings.
+    """
+    __tablename__ = "meter_hourly_usage"
+    device_id = Column(Integer, ForeignKey("meter_devices.id"), nullable=False)
+    hour = Column(DateTime(timezone=True), nullable=False)
+    kwh = Column(Float, nullable=False)
+    __table_args__ = (PrimaryKeyConstraint("device_id", "hour"),)
+
+
+
+class UsageTotal(Base):
+    """
+    Running usage total per user, resource, water category ("" for all
+    categories) and period (day/week/month starting at period_start). Kept
+    up to date on every log write by app.rollups.
+    """
+    __tablename__ = "usage_totals"
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    resource = Column(String, nullable=False)
+    category = Column(String, nullable=False, default="")
+    period = Column(String, nullable=False)
+    period_start = Column(Date, nullable=False)
+    total = Column(Float, nullable=False)
+    __table_args__ = (PrimaryKeyConstraint("user_id", "resource", "category", "period", "period_start"),)
+
+
+class UsageSketchBucket(Base):
+    """
+    One bucket of a log-bucketed quantile sketch (app.quantiles) over the
+    per-user totals of a resource, category and period: count is the number
+    of users whose total falls in the bucket.
+    """
+    __tablename__ = "usage_sketch_buckets"
+    resource = Column(String, nullable=False)
+    category = Column(String, nullable=False, default="")
+    period = Column(String, nullable=False)
+    period_start = Column(Date, nullable=False)
+    bucket = Column(Integer, nullable=False)
+    count = Column(Integer, nullable=False)
+    __table_args__ = (PrimaryKeyConstraint("resource", "category", "period", "period_start", "bucket"),)
+
+
+class Budget(Base):
+    """
+    A usage limit per day, week or month for a resource, optionally for a
+    single water category (category "" means all).
+    """
+    __tablename__ = "budgets"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    resource = Column(String, nullable=False)
+    category = Column(String, nullable=False, default="")
+    period = Column(String, nullable=False)
+    limit_qty = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_budgets_user_key", "user_id", "resource", "category", "period", unique=True),)
+
+
+class BudgetAlert(Base):
+    """
+    Raised the first time a budget is exceeded in a period; delivered_at is
+    set once the notifier has sent it.
+    """
+    __tablename__ = "budget_alerts"
+    id = Column(Integer, primary_key=True, index=True)
+    budget_id = Column(Integer, ForeignKey("budgets.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    period_start = Column(Date, nullable=False)
+    total = Column(Float, nullable=False)
+    limit_qty = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    delivered_at = Column(DateTime, nullable=True)
+    __table_args__ = (
+        Index("ix_budget_alerts_budget_period", "budget_id", "period_start", unique=True),
+        Index("ix_budget_alerts_user_id", "user_id"),
+    )
+
+
+class Household(Base):
+    """
+    A group of users sharing a household. Users join with invite_code and
+    belong to at most one household.
+    """
+    __tablename__ = "households"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    invite_code = Column(String, unique=True, index=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class HouseholdMember(Base):
+    __tablename__ = "household_members"
+    household_id = Column(Integer, ForeignKey("households.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    role = Column(String, nullable=False, default="member")
+    joined_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        PrimaryKeyConstraint("household_id", "user_id"),
+        Index("ix_household_members_user_id", "user_id", unique=True),
+    )
+
+
+class HouseholdUsageTotal(Base):
+    """
+    usage_totals summed over a household's members, kept up to date by
+    app.households on every member's log writes and on joins and leaves.
+    """
+    __tablename__ = "household_usage_totals"
+    household_id = Column(Integer, ForeignKey("households.id", ondelete="CASCADE"), nullable=False)
+    resource = Column(String, nullable=False)
+    category = Column(String, nullable=False, default="")
+    period = Column(String, nullable=False)
+    period_start = Column(Date, nullable=False)
+    total = Column(Float, nullable=False)
+    __table_args__ = (PrimaryKeyConstraint("household_id", "resource", "category", "period", "period_start"),)
+
+
+class RateLimitBucket(Base):
+    """
+    Token bucket shared between workers by app.ratelimit.DatabaseStore.
+    Unlogged: the buckets are disposable and written on every login attempt.
+    """
+    __tablename__ = "rate_limit_buckets"
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    # Seconds since the epoch, by the database clock
+    updated_at = Column(Float, nullable=False)
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+
+LOG_MODELS = {
+    "water": WaterLog,
+    "energy": EnergyLog,
+}
+
+ARCHIVE_MODELS = {
+    "water": WaterLogArchive,
+    "energy": EnergyLogArchive,
+}
+
+# Quantity column summed for each resource
+USAGE_COLUMNS = {
+    "water": WaterLog.qty_litres,
+    "energy": EnergyLog.qty,
+}
@@ -0,0 +1,244 @@
+"""
+On-demand sampling profiler for diagnosing slow endpoints in production.
+
+A Sampler thread snapshots thread stacks with sys._current_frames() every
+PROFILE_SAMPLE_INTERVAL seconds and counts them in the collapsed-stack
+format ("outer;inner;leaf count" per line) read by flamegraph.pl,
+speedscope and inferno. It runs in two modes:
+
+- capture_process() samples every thread for a fixed time,
+- RequestCapture samples only the threads running the next N requests to
+  one route. Arming it swaps the route's endpoint for a wrapper that
+  registers the worker thread with the sampler; once N requests have been
+  profiled the original endpoint is put back. Unarmed routes run their
+  endpoints untouched, so the profiler costs nothing while idle.
+
+Captures are per worker process: with several workers, a request capture
+only sees the requests that land on the worker that armed it, and only
+that worker can report on it. Capture ids start with the worker's pid, so
+a request for a capture that reached another worker can say so
+(capture_worker()) instead of reporting it missing.
+"""
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from fastapi.routing import APIRoute
+
+from .config import settings
+
+# Finished request captures kept for download, oldest dropped first
+MAX_CAPTURES = 20
+
+
+def collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        filename = code.co_filename.rsplit("/", 1)[-1]
+        stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":"))
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class Sampler:
+    """
+    Samples the stacks of the threads in `threads`, or of every thread but
+    its own if `threads` is None, until stopped.
+    """
+
+    def __init__(self, interval: float = None, threads: set = None):
+        self.interval = interval or settings.PROFILE_SAMPLE_INTERVAL
+        self.threads = threads
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            threads = self.threads
+            if threads is not None and not threads:
+                continue
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (threads is not None and ident not in threads):
+                    continue
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                self.stacks[f"{names.get(ident, ident)};{collapse(frame)}"] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+async def capture_process(seconds: float) -> str:
+    """
+    Sample every thread of this worker for `seconds` and return collapsed
+    stacks. Sleeps without blocking the event loop, whose own stacks are
+    sampled too.
+    """
+    sampler = Sampler().start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+    return sampler.collapsed()
+
+
+class RequestCapture:
+    """
+    Profiles the next `count` requests to the given APIRoutes (one path,
+    possibly several methods).
+    """
+
+    def __init__(self, routes: list, count: int):
+        self.worker = os.getpid()
+        self.id = f"{self.worker}-{uuid.uuid4().hex}"
+        self.path = routes[0].path
+        self.methods = sorted(set().union(*(route.methods for route in routes)))
+        self.count = count
+        self.started = 0
+        self.finished = 0
+        self.created_at = time.time()
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = set()
+        self._routes = [(route, route.dependant.call) for route in routes]
+        self._sampler = Sampler(threads=self._threads)
+
+    def arm(self):
+        self._sampler.start()
+        for route, call in self._routes:
+            route.dependant.call = self._wrap(call)
+
+    def cancel(self):
+        with self._lock:
+            self.count = self.started
+            if self.finished == self.started:
+                self._finish()
+
+    def _claim(self) -> bool:
+        with self._lock:
+            if self.started >= self.count:
+                return False
+            self.started += 1
+            self._threads.add(threading.get_ident())
+            return True
+
+    def _release(self):
+        with self._lock:
+            self._threads.discard(threading.get_ident())
+            self.finished += 1
+            if self.finished >= self.count:
+                self._finish()
+
+    def _finish(self):
+        # Called with the lock held
+        if self.done.is_set():
+            return
+        for route, call in self._routes:
+            route.dependant.call = call
+        self._sampler.stop()
+        self.done.set()
+
+    def _wrap(self, call):
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def profiled(*args, **kwargs):
+                # Async endpoints share the event loop thread, so samples
+                # also include whatever else the loop runs meanwhile
+                if not self._claim():
+                    return await call(*args, **kwargs)
+                try:
+                    return await call(*args, **kwargs)
+                finally:
+                    self._release()
+        else:
+            @functools.wraps(call)
+            def profiled(*args, **kwargs):
+                if not self._claim():
+                    return call(*args, **kwargs)
+                try:
+                    return call(*args, **kwargs)
+                finally:
+                    self._release()
+        return profiled
+
+    def status(self) -> dict:
+        return {
+            "id": self.id,
+            "worker": self.worker,
+            "path": self.path,
+            "methods": self.methods,
+            "count": self.count,
+            "profiled": self.finished,
+            "samples": sum(self._sampler.stacks.values()),
+            "done": self.done.is_set(),
+        }
+
+    def collapsed(self) -> str:
+        return self._sampler.collapsed()
+
+
+_captures = OrderedDict()
+_captures_lock = threading.Lock()
+
+
+def start_request_capture(app, path: str, count: int, method: str = None) -> RequestCapture:
+    """
+    Arm a capture of the next `count` requests to the route with this path
+    template (e.g. "/water-logs/logs-by-month"), optionally for one method.
+    Raises LookupError for an unknown route and ValueError if the route is
+    already being profiled.
+    """
+    routes = [
+        route for route in app.routes
+        if isinstance(route, APIRoute) and route.path == path and (method is None or method.upper() in route.methods)
+    ]
+    if not routes:
+        raise LookupError(f"No route matches {method.upper() + ' ' if method else ''}{path}.")
+    with _captures_lock:
+        if any(not capture.done.is_set() and capture.path == path for capture in _captures.values()):
+            raise ValueError(f"{path} is already being profiled.")
+        capture = RequestCapture(routes, count)
+        _captures[capture.id] = capture
+        # Unfinished captures stay; there is at most one per route
+        finished = [capture_id for capture_id, kept in _captures.items() if kept.done.is_set()]
+        for capture_id in finished[:max(0, len(_captures) - MAX_CAPTURES)]:
+            del _captures[capture_id]
+    capture.arm()
+    return capture
+
+
+def get_capture(capture_id: str) -> RequestCapture:
+    with _captures_lock:
+        return _captures.get(capture_id)
+
+
+def capture_worker(capture_id: str):
+    """
+    Pid of the worker that armed the capture with this id, or None if the
+    id isn't one.
+    """
+    pid, _, _ = capture_id.partition("-")
+    return int(pid) if pid.isdigit() else None
+
+
+def list_captures() -> list:
+    with _captures_lock:
+        captures = list(reversed(_captures.values()))
+    return [capture.status() for capture in captures]
@@ -0,0 +1,195 @@
+"""
+Cross-user percentile comparisons.
+
+For every resource, water category and day/month period we keep a
+log-bucketed quantile sketch (the DDSketch scheme) of the per-user totals
+in usage_totals. A total x lands in bucket ceil(log_gamma(x)), so every
+estimate is within RELATIVE_ACCURACY of the true value. The sketch is a
+table of per-bucket user counts:
+
+- it's mergeable: sketches over any set of keys combine by adding counts,
+- a log write moves one user from the bucket of their old total to the
+  bucket of their new one, so updates are two counter increments and
+  deletes are exact (unlike t-digest, which can't remove points),
+- a percentile reads one key's buckets, whose number is bounded by the
+  value range (~1,000 for 0.01 to 10^6 at 1% accuracy), not by user count.
+
+Sketches and totals are updated incrementally by app.rollups. Rebuild both
+from the logs after a migration or to correct drift:
+
+    python -m app.quantiles rebuild
+"""
+import argparse
+import math
+from collections import defaultdict
+from datetime import date
+
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .models import UsageSketchBucket, UsageTotal
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+SKETCH_PERIODS = ["day", "month"]
+QUANTILES = [0.25, 0.5, 0.75, 0.9]
+# Totals within this of zero are treated as zero (float residue of deletes)
+EPSILON = 1e-9
+
+
+def bucket_for(value: float) -> int:
+    return math.ceil(math.log(value) / LOG_GAMMA)
+
+
+def bucket_value(bucket: int) -> float:
+    """
+    Representative value of a bucket, within RELATIVE_ACCURACY of any value
+    that maps to it.
+    """
+    return 2 * GAMMA ** bucket / (GAMMA + 1)
+
+
+def update_sketches(db: Session, transitions):
+    """
+    Move each user from the bucket of their old total to the bucket of their
+    new one, given (key, old_total, new_total) transitions from
+    app.rollups.record_usage_changes. One upsert for the whole batch.
+    """
+    deltas = defaultdict(int)
+    for (user_id, resource, category, period, start), old, new in transitions:
+        if period not in SKETCH_PERIODS:
+            continue
+        if old > EPSILON:
+            deltas[(resource, category, period, start, bucket_for(old))] -= 1
+        if new > EPSILON:
+            deltas[(resource, category, period, start, bucket_for(new))] += 1
+    # Sorted so concurrent writers lock bucket rows in the same order
+    keys = sorted(key for key, count in deltas.items() if count)
+    if not keys:
+        return
+
+    stmt = pg_insert(UsageSketchBucket).values([
+        {"resource": key[0], "category": key[1], "period": key[2], "period_start": key[3], "bucket": key[4], "count": deltas[key]}
+        for key in keys
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["resource", "category", "period", "period_start", "bucket"],
+        set_={"count": UsageSketchBucket.count + stmt.excluded.count},
+    ))
+
+
+def compare(db: Session, user_id: int, resource: str, category: str, period: str, start: date) -> dict:
+    """
+    Where a user's total for one period sits among all users with usage in
+    that period: percentile (share of users using less, counting ties as
+    half) and approximate quartiles/p90. Two primary-key lookups.
+    """
+    total = db.execute(
+        select(UsageTotal.total).where(
+            UsageTotal.user_id == user_id,
+            UsageTotal.resource == resource,
+            UsageTotal.category == category,
+            UsageTotal.period == period,
+            UsageTotal.period_start == start,
+        )
+    ).scalar() or 0
+    buckets = db.execute(
+        select(UsageSketchBucket.bucket, UsageSketchBucket.count)
+        .where(
+            UsageSketchBucket.resource == resource,
+            UsageSketchBucket.category == category,
+            UsageSketchBucket.period == period,
+            UsageSketchBucket.period_start == start,
+            UsageSketchBucket.count > 0,
+        )
+        .order_by(UsageSketchBucket.bucket)
+    ).all()
+    users = sum(count for _, count in buckets)
+
+    percentile = None
+    if users:
+        if total > EPSILON:
+            own = bucket_for(total)
+            below = sum(count for bucket, count in buckets if bucket < own)
+            tied = sum(count for bucket, count in buckets if bucket == own)
+            percentile = 100 * (below + tied / 2) / users
+        else:
+            percentile = 0.0
+
+    quantiles = {}
+    for q in QUANTILES:
+        rank, seen = q * (users - 1), 0
+        for bucket, count in buckets:
+            seen += count
+            if seen > rank:
+                quantiles[f"p{int(q * 100)}"] = bucket_value(bucket)
+                break
+
+    return {
+        "total": total,
+        "percentile": percentile,
+        "users": users,
+        "quantiles": quantiles,
+    }
+
+
+def rebuild_sketches(db: Session):
+    """
+    Recompute every sketch from usage_totals. Runs in the caller's
+    transaction.
+    """
+    db.execute(delete(UsageSketchBucket))
+    counts = defaultdict(int)
+    rows = db.execute(
+        select(UsageTotal.resource, UsageTotal.category, UsageTotal.period, UsageTotal.period_start, UsageTotal.total)
+        .where(UsageTotal.period.in_(SKETCH_PERIODS), UsageTotal.total > EPSILON)
+        .execution_options(yield_per=10000)
+    )
+    for resource, category, period, start, total in rows:
+        counts[(resource, category, period, start, bucket_for(total))] += 1
+
+    batch = []
+    for (resource, category, period, start, bucket), count in counts.items():
+        batch.append({"resource": resource, "category": category, "period": period, "period_start": start, "bucket": bucket, "count": count})
+        if len(batch) >= 10000:
+            db.execute(insert(UsageSketchBucket), batch)
+            batch = []
+    if batch:
+        db.execute(insert(UsageSketchBucket), batch)
+
+
+def rebuild(db: Session):
+    """
+    Rebuild usage totals, household totals and sketches in one transaction.
+    The tables are locked first, so concurrent log writes wait and then
+    apply on top of the rebuilt state instead of being lost.
+    """
+    from .households import rebuild_household_totals
+    from .rollups import rebuild_totals
+
+    db.execute(text("LOCK TABLE usage_totals, household_usage_totals, usage_sketch_buckets IN EXCLUSIVE MODE"))
+    rebuild_totals(db)
+    rebuild_household_totals(db)
+    rebuild_sketches(db)
+    db.commit()
+
+
+def main(argv=None):
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the usage quantile sketches.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        rebuild(db)
+    finally:
+        db.close()
+    print("rebuilt usage totals, household totals and quantile sketches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from sqlalchemy import ARRAY, Integer, any_, literal, select, update
+from sqlalchemy.orm import Session
+
+from .models import User
+
+
+def user_id_for(username: str):
+    """
+    Scalar subquery resolving a username to its id, so write statements can
+    scope themselves to the current user without a separate lookup.
+    """
+    return select(User.id).where(User.username == username).scalar_subquery()
+
+
+def id_in(column, ids):
+    """
+    ``column = ANY(:ids)`` with the ids bound as a single array parameter,
+    which keeps one statement shape whatever the number of ids.
+    """
+    return column == any_(literal(list(ids), ARRAY(Integer)))
+
+
+def bulk_delete_filters(model, username: str, criteria) -> list:
+    """
+    WHERE clauses for a bulk delete of ``model`` rows owned by ``username``,
+    narrowed by the ids and/or date range in a LogBulkDelete payload.
+    """
+    filters = [model.user_id == user_id_for(username)]
+    if criteria.ids is not None:
+        filters.append(id_in(model.id, criteria.ids))
+    if criteria.start_date is not None:
+        filters.append(model.date >= criteria.start_date)
+    if criteria.end_date is not None:
+        filters.append(model.date <= criteria.end_date)
+    return filters
+
+
+# Columns whose previous values update_logs() returns
+TRACKED_COLUMNS = ["user_id", "date", "category", "qty", "qty_litres"]
+
+
+def update_logs(db: Session, model, values: dict, *filters) -> list:
+    """
+    UPDATE ... RETURNING for log rows matching filters. Each returned row
+    has the full updated row plus the tracked columns as they were before
+    the update, prefixed with "old_" (read through a FOR UPDATE self-join,
+    still one statement).
+    """
+    tracked = [name for name in TRACKED_COLUMNS if name in model.__table__.c]
+    old = (
+        select(model.id, *[getattr(model, name) for name in tracked])
+        .where(*filters)
+        .with_for_update()
+        .subquery("old")
+    )
+    return db.execute(
+        update(model)
+        .where(model.id == old.c.id)
+        .values(values)
+        .returning(*model.__table__.c, *[old.c[name].label("old_" + name) for name in tracked])
+        .execution_options(synchronize_session=False)
+    ).all()
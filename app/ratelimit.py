@@ -0,0 +1,192 @@
+"""
+Token-bucket admission control for the authentication endpoints.
+
+/auth/token and /auth/register spend most of their time in bcrypt, so a
+burst of login attempts can starve every other endpoint on the worker.
+auth_rate_limit() returns a dependency that charges one token per request
+to a bucket per client IP and one per username, and answers 429 before the
+endpoint hashes anything or touches the database.
+
+Buckets live in the store selected by the RATE_LIMIT_STORE setting:
+MemoryStore (the default) keeps them per worker; DatabaseStore shares them
+between workers and hosts through an unlogged table. Behind a reverse
+proxy, set FORWARDED_ALLOW_IPS so the client IP is the real one.
+"""
+import abc
+import importlib
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import case, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from .models import RateLimitBucket
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_limit(spec: str):
+    """
+    "5/minute" -> (refill rate in tokens per second, burst size).
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(second|minute|hour|day)\s*", spec)
+    if match is None:
+        raise ValueError(f"Invalid rate limit {spec!r}, expected e.g. '5/minute'.")
+    count = int(match.group(1))
+    return count / PERIODS[match.group(2)], count
+
+
+class Store(abc.ABC):
+    """
+    Holds token buckets. take() refills the bucket by the time elapsed since
+    its last use, then takes a token if there is one, returning (allowed,
+    seconds until a token is available).
+    """
+    # True if take() does I/O and must run off the event loop
+    blocking = False
+
+    @abc.abstractmethod
+    def take(self, scope: str, key: str, rate: float, burst: int):
+        ...
+
+
+class MemoryStore(Store):
+    """
+    Per-process buckets: a (tokens, last_used) pair per key, in one
+    least-recently-used ordered dict per scope. A bucket idle long enough to
+    have refilled is identical to a missing one, so idle buckets are dropped
+    from the front of the dict as requests come in; at most
+    RATE_LIMIT_MAX_KEYS are kept per scope, evicting the least recently used.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, scope: str, key: str, rate: float, burst: int):
+        now = time.monotonic()
+        with self._lock:
+            buckets = self._buckets.setdefault(scope, OrderedDict())
+            idle = burst / rate
+            while buckets:
+                oldest = next(iter(buckets.values()))
+                if now - oldest[1] < idle and len(buckets) < settings.RATE_LIMIT_MAX_KEYS:
+                    break
+                buckets.popitem(last=False)
+
+            bucket = buckets.pop(key, None)
+            tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            buckets[key] = (tokens, now)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+class DatabaseStore(Store):
+    """
+    Buckets shared by every worker, in the unlogged rate_limit_buckets table
+    (no WAL, so a crash just resets them). Each take is one transaction: an
+    insert of a full bucket if the key is new, then an UPDATE ... FROM a
+    FOR UPDATE read of the bucket, so concurrent workers never both spend
+    the same token. Time comes from the database clock.
+    """
+    blocking = True
+    # Delete idle buckets about once every this many takes
+    SWEEP_EVERY = 1000
+
+    def __init__(self):
+        self._takes = 0
+
+    def take(self, scope: str, key: str, rate: float, burst: int):
+        from .database import engine
+
+        key = f"{scope}:{key}"
+        now = func.extract("epoch", func.clock_timestamp())
+        with engine.begin() as connection:
+            connection.execute(
+                pg_insert(RateLimitBucket)
+                .values(key=key, tokens=burst, updated_at=now)
+                .on_conflict_do_nothing(index_elements=["key"])
+            )
+            current = (
+                select(
+                    RateLimitBucket.key,
+                    func.least(burst, RateLimitBucket.tokens + func.greatest(now - RateLimitBucket.updated_at, 0) * rate).label("tokens"),
+                )
+                .where(RateLimitBucket.key == key)
+                .with_for_update()
+                .subquery("current")
+            )
+            allowed = current.c.tokens >= 1
+            row = connection.execute(
+                update(RateLimitBucket)
+                .where(RateLimitBucket.key == current.c.key)
+                .values(tokens=current.c.tokens - case((allowed, 1), else_=0), updated_at=now)
+                .returning(allowed.label("allowed"), current.c.tokens)
+            ).one()
+
+            self._takes += 1
+            if self._takes % self.SWEEP_EVERY == 0:
+                # Every configured limit refills within a day
+                connection.execute(
+                    RateLimitBucket.__table__.delete().where(RateLimitBucket.updated_at < now - literal(PERIODS["day"]))
+                )
+        return row.allowed, 0 if row.allowed else (1 - row.tokens) / rate
+
+
+_store = None
+
+
+def get_store() -> Store:
+    global _store
+    if _store is None:
+        module_name, _, class_name = settings.RATE_LIMIT_STORE.rpartition(".")
+        _store = getattr(importlib.import_module(module_name), class_name)()
+    return _store
+
+
+async def request_username(request: Request):
+    # The body has already been read by FastAPI, so this parses the cached bytes
+    try:
+        body = await request.json()
+    except Exception:
+        return None
+    username = body.get("username") if isinstance(body, dict) else None
+    return username.strip().lower() if isinstance(username, str) else None
+
+
+def auth_rate_limit(scope: str):
+    """
+    Dependency limiting an endpoint to AUTH_RATE_LIMIT_IP requests per
+    client IP and AUTH_RATE_LIMIT_USERNAME per username in the JSON body.
+    """
+    ip_rate, ip_burst = parse_limit(settings.AUTH_RATE_LIMIT_IP)
+    user_rate, user_burst = parse_limit(settings.AUTH_RATE_LIMIT_USERNAME)
+
+    async def check_rate_limit(request: Request):
+        buckets = [(f"{scope}:ip", request.client.host if request.client else "unknown", ip_rate, ip_burst)]
+        username = await request_username(request)
+        if username:
+            buckets.append((f"{scope}:user", username, user_rate, user_burst))
+
+        store = get_store()
+        for bucket_scope, key, rate, burst in buckets:
+            if store.blocking:
+                allowed, retry_after = await run_in_threadpool(store.take, bucket_scope, key, rate, burst)
+            else:
+                allowed, retry_after = store.take(bucket_scope, key, rate, burst)
+            if not allowed:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many attempts, please try again later.",
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
+
+    return check_rate_limit
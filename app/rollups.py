@@ -0,0 +1,133 @@
+"""
+Incrementally maintained usage totals.
+
+Every log write passes the usage it added or removed to
+record_usage_changes(), which folds it into usage_totals in two statements
+and hands the resulting old -> new transitions to the features built on
+per-period totals (quantile sketches, household totals, budget alerts).
+Nothing here rescans logs except rebuild_totals(), run by
+`python -m app.quantiles rebuild`.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import Date, Float, Integer, String, and_, cast, column, delete, func, insert, literal, select, union_all, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .models import ArchivedDailyUsage, UsageTotal, USAGE_COLUMNS
+from .quantiles import update_sketches, EPSILON
+from .budgets import check_budgets
+from .households import update_household_totals
+
+PERIODS = ["day", "week", "month"]
+TOTAL_KEY = ["user_id", "resource", "category", "period", "period_start"]
+ALL_CATEGORIES = ""
+
+
+def period_start(day: date, period: str) -> date:
+    if period == "month":
+        return day.replace(day=1)
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def log_deltas(resource: str, rows, sign: int = 1, prefix: str = "") -> list:
+    """
+    (user_id, date, category, signed quantity) for each log row, read from
+    attributes named prefix + column (e.g. "old_" for update pre-images).
+    Works for ORM objects and RETURNING rows alike.
+    """
+    column = USAGE_COLUMNS[resource].key
+    deltas = []
+    for row in rows:
+        category = getattr(row, prefix + "category") if resource == "water" else None
+        qty = getattr(row, prefix + column) or 0
+        deltas.append((getattr(row, prefix + "user_id"), getattr(row, prefix + "date"), category, sign * qty))
+    return deltas
+
+
+def record_usage_changes(db: Session, resource: str, deltas) -> list:
+    """
+    Add per-day usage deltas to the user's day, week and month totals,
+    overall and per water category, in one insert and one update. Returns
+    (key, old_total, new_total) for every total that moved, key being (user_id, resource,
+    category, period, period_start). Runs inside the caller's transaction.
+    """
+    changes = defaultdict(float)
+    for user_id, day, category, qty in deltas:
+        if not qty or day is None:
+            continue
+        categories = [ALL_CATEGORIES] if category is None else [ALL_CATEGORIES, category.name]
+        for category_key in categories:
+            for period in PERIODS:
+                changes[(user_id, resource, category_key, period, period_start(day, period))] += qty
+    # Sorted so concurrent writers lock total rows in the same order
+    keys = sorted(key for key, qty in changes.items() if abs(qty) > EPSILON)
+    if not keys:
+        return []
+
+    # Create the missing totals at zero, then lock them all in key order
+    # and add the deltas, returning the stored pre-image next to the new
+    # total: rebuilding the old total from new - delta can round into a
+    # different sketch bucket than the one it was counted in
+    db.execute(pg_insert(UsageTotal).values([dict(zip(TOTAL_KEY, key), total=0) for key in keys]).on_conflict_do_nothing())
+    deltas = values(
+        column("user_id", Integer), column("resource", String), column("category", String),
+        column("period", String), column("period_start", Date), column("delta", Float),
+        name="deltas",
+    ).data([(*key, changes[key]) for key in keys])
+    key_columns = [getattr(UsageTotal, name) for name in TOTAL_KEY]
+    current = (
+        select(*key_columns, UsageTotal.total, deltas.c.delta)
+        .join(deltas, and_(*[key_column == deltas.c[key_column.key] for key_column in key_columns]))
+        # Byte order for strings, the order the keys were sorted and inserted in
+        .order_by(*[key_column.collate("C") if isinstance(key_column.type, String) else key_column for key_column in key_columns])
+        .with_for_update(of=UsageTotal)
+        .subquery("current")
+    )
+    rows = db.execute(
+        update(UsageTotal)
+        .where(*[key_column == current.c[key_column.key] for key_column in key_columns])
+        .values(total=current.c.total + current.c.delta)
+        .returning(*key_columns, current.c.total.label("old_total"), UsageTotal.total)
+    ).all()
+
+    transitions = []
+    for row in rows:
+        key = (row.user_id, row.resource, row.category, row.period, row.period_start)
+        transitions.append((key, row.old_total, row.total))
+    update_sketches(db, transitions)
+    update_household_totals(db, transitions)
+    check_budgets(db, transitions)
+    return transitions
+
+
+def rebuild_totals(db: Session):
+    """
+    Recompute usage_totals from scratch out of the hot logs and the archived
+    daily totals. Runs in the caller's transaction.
+    """
+    db.execute(delete(UsageTotal))
+    for resource, column in USAGE_COLUMNS.items():
+        model = column.class_
+        hot_category = cast(model.category, String) if resource == "water" else literal("")
+        source = union_all(
+            select(model.user_id, model.date.label("day"), hot_category.label("category"), column.label("qty")),
+            select(ArchivedDailyUsage.user_id, ArchivedDailyUsage.date, ArchivedDailyUsage.category, ArchivedDailyUsage.total)
+            .where(ArchivedDailyUsage.resource == resource),
+        ).subquery()
+
+        for period in PERIODS:
+            start = source.c.day if period == "day" else cast(func.date_trunc(period, source.c.day), Date)
+            variants = [(literal(ALL_CATEGORIES), [])]
+            if resource == "water":
+                variants.append((source.c.category, [source.c.category]))
+            for category, group_by in variants:
+                db.execute(insert(UsageTotal).from_select(
+                    ["user_id", "resource", "category", "period", "period_start", "total"],
+                    select(source.c.user_id, literal(resource), category, literal(period), start, func.sum(source.c.qty))
+                    .where(source.c.day.is_not(None))
+                    .group_by(source.c.user_id, start, *group_by),
+                ))
@@ -1 +1 @@
-from . import auth, energy_logs, general, water_logs
\ No newline at end of file
+from . import admin, auth, budgets, energy_logs, general, health, households, live, meter_readings, sync, water_logs
\ No newline at end of file
@@ -0,0 +1,94 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse
+from typing import List
+
+from ..auth import get_admin_user
+from ..config import settings
+from ..schemas import ProfileRequest
+from ..profiling import capture_process, capture_worker, get_capture, list_captures, start_request_capture
+
+
+def profiling_enabled():
+    # The profiling endpoints don't exist unless PROFILING_ENABLED is set
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+
+router = APIRouter(dependencies=[Depends(profiling_enabled), Depends(get_admin_user)])
+
+
+def find_capture(capture_id: str):
+    capture = get_capture(capture_id)
+    if capture is not None:
+        return capture
+    worker = capture_worker(capture_id)
+    if worker is not None and worker != os.getpid():
+        # Profiles live in the worker that armed them; a new connection
+        # may be balanced onto it
+        raise HTTPException(
+            status_code=status.HTTP_421_MISDIRECTED_REQUEST,
+            detail=f"Profile belongs to worker {worker} but this request reached worker {os.getpid()}; retry on a new connection.",
+        )
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found.")
+
+
+@router.post("/profile/requests", response_model=dict, status_code=status.HTTP_201_CREATED)
+def profile_requests(profile: ProfileRequest, request: Request):
+    """
+    Profile the next `count` requests to the route with path template
+    `path` on this worker, optionally only for one `method`. Poll the
+    returned id for progress and download the stacks when done.
+    """
+    if not 1 <= profile.count <= 1000:
+        raise HTTPException(status_code=400, detail="count must be between 1 and 1000.")
+    try:
+        return start_request_capture(request.app, profile.path, profile.count, profile.method).status()
+    except LookupError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+@router.get("/profile/requests", response_model=List[dict])
+def get_request_profiles():
+    """
+    Request captures on this worker, newest first.
+    """
+    return list_captures()
+
+
+@router.get("/profile/requests/{capture_id}", response_model=dict)
+def get_request_profile(capture_id: str):
+    capture = find_capture(capture_id)
+    return capture.status()
+
+
+@router.get("/profile/requests/{capture_id}/collapsed", response_class=PlainTextResponse)
+def get_request_profile_stacks(capture_id: str):
+    """
+    Collapsed stacks sampled so far, for flamegraph.pl, speedscope or
+    inferno-flamegraph.
+    """
+    capture = find_capture(capture_id)
+    return capture.collapsed()
+
+
+@router.delete("/profile/requests/{capture_id}", response_model=dict)
+def cancel_request_profile(capture_id: str):
+    """
+    Stop profiling once the requests already being profiled finish.
+    """
+    capture = find_capture(capture_id)
+    capture.cancel()
+    return capture.status()
+
+
+@router.get("/profile/process", response_class=PlainTextResponse)
+async def profile_process(seconds: float = Query(10, gt=0, le=60)):
+    """
+    Sample every thread of the worker serving this request for `seconds`
+    and return collapsed stacks.
+    """
+    return await capture_process(seconds)
@@ -5,12 +5,13 @@ from sqlalchemy import or_
 from ..database import get_db
 from ..models import User
 from ..auth import verify_password, hash_password, JWTBearer, verify_access_token, oauth2_scheme
+from ..ratelimit import auth_rate_limit
 from ..schemas import UserCreate, UserResponse, UserLogin, Token, VerifyAccessToken
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 router = APIRouter()
 
-@router.post("/register", response_model=UserResponse)
+@router.post("/register", response_model=UserResponse, dependencies=[Depends(auth_rate_limit("register"))])
 def register_user(user: UserCreate, db: Session = Depends(get_db)):
     # Check if the username already exists
     existing_user = db.query(User).filter(or_(User.username == user.username, User.email==user.email)).first()
@@ -33,7 +34,7 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
     return new_user
 
 
-@router.post("/token", response_model=Token)
+@router.post("/token", response_model=Token, dependencies=[Depends(auth_rate_limit("token"))])
 def login(credentials: UserLogin, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.username == credentials.username).first()
 
@@ -0,0 +1,166 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from datetime import datetime
+from typing import List
+
+from ..database import get_db
+from ..models import Budget, BudgetAlert, UsageTotal, User, WaterCategory
+from ..schemas import BudgetCreate, BudgetResponse, BudgetAlertResponse
+from ..auth import get_current_user
+from ..budgets import raise_alerts
+from ..queries import user_id_for
+from ..rollups import period_start, ALL_CATEGORIES, PERIODS
+
+router = APIRouter()
+
+
+def budget_status(db: Session, user_id: int, budget_filter=None) -> list:
+    """
+    The user's budgets with their usage so far in the current period, read
+    from the running totals (one join, no log scan).
+    """
+    today = datetime.now().date()
+    starts = {period: period_start(today, period) for period in PERIODS}
+    current = [and_(UsageTotal.period == period, UsageTotal.period_start == start) for period, start in starts.items()]
+    stmt = (
+        select(Budget, UsageTotal.total)
+        .outerjoin(UsageTotal, and_(
+            UsageTotal.user_id == Budget.user_id,
+            UsageTotal.resource == Budget.resource,
+            UsageTotal.category == Budget.category,
+            UsageTotal.period == Budget.period,
+            or_(*current),
+        ))
+        .where(Budget.user_id == user_id)
+        .order_by(Budget.resource, Budget.period, Budget.category)
+    )
+    if budget_filter is not None:
+        stmt = stmt.where(budget_filter)
+    result = []
+    for budget, used in db.execute(stmt).all():
+        used = used or 0
+        result.append({
+            "id": budget.id,
+            "resource": budget.resource,
+            "category": WaterCategory[budget.category] if budget.category else None,
+            "period": budget.period,
+            "limit_qty": budget.limit_qty,
+            "period_start": starts[budget.period],
+            "used": used,
+            "exceeded": used > budget.limit_qty,
+        })
+    return result
+
+
+@router.get("/", response_model=List[BudgetResponse])
+def get_budgets(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    List the user's budgets with how much of each has been used in the
+    current day, week or month.
+    """
+    try:
+        user = db.query(User).filter(User.username == current_user).first()
+        return budget_status(db, user.id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error retrieving budgets: {str(e)}")
+
+
+@router.put("/", response_model=BudgetResponse)
+def set_budget(
+    budget: BudgetCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Create a budget, or change the limit of the user's existing budget for
+    the same resource, category and period. Limits are litres for water and
+    kWh for energy. If the current period is already over the new limit an
+    alert is raised straight away.
+    """
+    if budget.category is not None and budget.resource != "water":
+        raise HTTPException(status_code=400, detail="Categories only apply to water.")
+    if budget.limit_qty <= 0:
+        raise HTTPException(status_code=400, detail="The limit must be positive.")
+    try:
+        user = db.query(User).filter(User.username == current_user).first()
+        category = budget.category.name if budget.category is not None else ALL_CATEGORIES
+        stmt = pg_insert(Budget).values(
+            user_id=user.id,
+            resource=budget.resource,
+            category=category,
+            period=budget.period,
+            limit_qty=budget.limit_qty,
+            created_at=datetime.utcnow(),
+        )
+        budget_id = db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "resource", "category", "period"],
+            set_={"limit_qty": stmt.excluded.limit_qty},
+        ).returning(Budget.id)).scalar_one()
+
+        result = budget_status(db, user.id, Budget.id == budget_id)[0]
+        if result["exceeded"]:
+            raise_alerts(db, [{
+                "budget_id": budget_id,
+                "user_id": user.id,
+                "period_start": result["period_start"],
+                "total": result["used"],
+                "limit_qty": result["limit_qty"],
+                "created_at": datetime.utcnow(),
+            }])
+        db.commit()
+        return result
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error saving budget: {str(e)}")
+
+
+@router.delete("/{budget_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_budget(
+    budget_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Delete a budget and its alerts.
+    """
+    try:
+        deleted = db.execute(
+            delete(Budget)
+            .where(Budget.id == budget_id, Budget.user_id == user_id_for(current_user))
+            .returning(Budget.id)
+        ).scalar()
+        if deleted is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Budget not found.")
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error deleting budget: {str(e)}")
+
+
+@router.get("/alerts", response_model=List[BudgetAlertResponse])
+def get_budget_alerts(
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    The user's most recent budget alerts, newest first.
+    """
+    try:
+        return (
+            db.query(BudgetAlert)
+            .filter(BudgetAlert.user_id == user_id_for(current_user))
+            .order_by(BudgetAlert.created_at.desc(), BudgetAlert.id.desc())
+            .limit(limit)
+            .all()
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error retrieving budget alerts: {str(e)}")
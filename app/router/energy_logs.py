@@ -1,17 +1,18 @@
-import calendar
-import pandas as pd
-
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import extract, func, desc
-from fastapi.responses import StreamingResponse
-from io import BytesIO
-from datetime import datetime, timedelta
+from sqlalchemy import desc, select
 
 from ..database import get_db
 from ..models import EnergyLog, User
-from ..schemas import EnergyLogCreate, EnergyLogList, EnergyLogResponse, GenSummaryResponse
+from ..schemas import EnergyLogCreate, EnergyLogBulkUpdate, EnergyLogList, EnergyLogResponse, GenSummaryResponse, LogBulkDelete, BulkResult
+from ..queries import user_id_for, id_in, bulk_delete_filters, update_logs
 from ..auth import get_current_user
+from ..exports import excel_response
+from ..events import notify_logs_changed
+from ..sync import delete_logs, lock_log_changes
+from ..rollups import record_usage_changes, log_deltas
+from ..archive import log_rows
+from ..analytics import dashboard
 
 router = APIRouter()
 @router.get("/", response_model=EnergyLogList)
@@ -20,7 +21,7 @@ def get_all_energy_logs(
     current_user: User = Depends(get_current_user)
 ):
     """
-    Fetch all energy logs for the authenticated user.
+    Fetch all energy logs for the authenticated user, including archived ones.
     """
     try:
         user = db.query(User).filter(User.username == current_user).first()
@@ -30,7 +31,8 @@ def get_all_energy_logs(
                 detail="User not found.",
             )
         # Query all energy logs for the user
-        energy_logs = db.query(EnergyLog).filter(EnergyLog.user_id == user.id).order_by(desc(EnergyLog.date)).all()
+        logs = log_rows("energy", current_user)
+        energy_logs = db.execute(select(logs).order_by(desc(logs.c.date))).mappings().all()
         return {'result':energy_logs}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error retrieving energy logs: {str(e)}")
@@ -58,8 +60,11 @@ def create_energy_log(
             qty=energy_log.qty,
             unit=energy_log.unit,
         )
+        lock_log_changes(db, user.id)
         db.add(db_log)
+        record_usage_changes(db, "energy", log_deltas("energy", [db_log]))
         db.commit()
+        notify_logs_changed(current_user, "energy")
         db.refresh(db_log)
         return db_log
     except Exception as e:
@@ -67,38 +72,96 @@ def create_energy_log(
         raise HTTPException(status_code=400, detail=f"Error creating energy log: {str(e)}")
 
 
-@router.get("/logs-by-month", response_model=list)
-def get_energy_logs_grouped_by_month(
+@router.put("/{log_id}", response_model=EnergyLogResponse)
+def update_energy_log(
+    log_id: int,
+    energy_log: EnergyLogCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user) ,
+    current_user: User = Depends(get_current_user),
 ):
+    """
+    Replace a single energy log in one UPDATE ... RETURNING statement.
+    """
     try:
-        user = db.query(User).filter(User.username == current_user).first()
-        current_year = datetime.now().year
+        lock_log_changes(db, user_id_for(current_user))
+        rows = update_logs(db, EnergyLog, energy_log.model_dump(), EnergyLog.id == log_id, EnergyLog.user_id == user_id_for(current_user))
+        if not rows:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Energy log not found or does not belong to the current user.",
+            )
+        record_usage_changes(db, "energy", log_deltas("energy", rows, -1, "old_") + log_deltas("energy", rows))
+        updated = dict(rows[0]._mapping)
+        db.commit()
+        notify_logs_changed(current_user, "energy")
+        return updated
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error updating energy log: {str(e)}")
 
 
-        logs = (
-            db.query(
-                extract("month", EnergyLog.date).label("month"),
-                func.sum(EnergyLog.qty).label("total_qty"),
-                func.count(EnergyLog.id).label("log_count")
-            )
-            .filter(EnergyLog.user_id == user.id) 
-            .filter(extract("year", EnergyLog.date) == current_year)
-            .group_by(extract("month", EnergyLog.date))
-            .order_by(extract("month", EnergyLog.date))
-            .all()
-        )
+@router.patch("/", response_model=BulkResult)
+def bulk_update_energy_logs(
+    payload: EnergyLogBulkUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Apply the same partial update to a list of energy logs in one statement.
+    Ids that don't exist or belong to another user are skipped.
+    """
+    changes = payload.model_dump(exclude={"ids"}, exclude_unset=True, exclude_none=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="No fields to update.")
+    if not payload.ids:
+        return {"affected": 0, "ids": []}
+    try:
+        lock_log_changes(db, user_id_for(current_user))
+        rows = update_logs(db, EnergyLog, changes, EnergyLog.user_id == user_id_for(current_user), id_in(EnergyLog.id, payload.ids))
+        record_usage_changes(db, "energy", log_deltas("energy", rows, -1, "old_") + log_deltas("energy", rows))
+        ids = [row.id for row in rows]
+        db.commit()
+        notify_logs_changed(current_user, "energy")
+        return {"affected": len(ids), "ids": ids}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error updating energy logs: {str(e)}")
 
-        grouped_logs = [{"name": calendar.month_name[i][:3], "qty": 0} for i in range(1, 13)]
 
-        for log in logs:
-            month_name = calendar.month_name[int(log.month)][:3]
-            for entry in grouped_logs:
-                if entry["name"] == month_name:
-                    entry["qty"] = log.total_qty
+@router.delete("/", response_model=BulkResult)
+def bulk_delete_energy_logs(
+    criteria: LogBulkDelete,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Delete energy logs by id list and/or date range in one statement.
+    """
+    if criteria.ids is None and criteria.start_date is None and criteria.end_date is None:
+        raise HTTPException(status_code=400, detail="Provide ids or a date range to delete.")
+    try:
+        lock_log_changes(db, user_id_for(current_user))
+        rows = delete_logs(db, "energy", *bulk_delete_filters(EnergyLog, current_user, criteria))
+        record_usage_changes(db, "energy", log_deltas("energy", rows, -1))
+        ids = [row.id for row in rows]
+        db.commit()
+        notify_logs_changed(current_user, "energy")
+        return {"affected": len(ids), "ids": ids}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error deleting energy logs: {str(e)}")
+
 
-        return grouped_logs
+@router.get("/logs-by-month", response_model=list)
+def get_energy_logs_grouped_by_month(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user) ,
+):
+    try:
+        return dashboard(db, current_user, resources=["energy"], sections=["by_month"])["energy"]["by_month"]
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error retrieving energy logs: {str(e)}")
@@ -110,33 +173,7 @@ def get_energy_logs_grouped_by_current_week(
     current_user: User = Depends(get_current_user),
 ):
     try:
-        user = db.query(User).filter(User.username == current_user).first()
-
-        today = datetime.now()
-        start_of_week = today - timedelta(days=today.weekday())
-        end_of_week = start_of_week + timedelta(days=6)
-
-        logs = (
-            db.query(
-                extract("dow", EnergyLog.date).label("day_of_week"),
-                func.sum(EnergyLog.qty).label("total_qty")
-            )
-            .filter(EnergyLog.user_id == user.id)
-            .filter(EnergyLog.date >= start_of_week.date())
-            .filter(EnergyLog.date <= end_of_week.date())
-            .group_by(extract("dow", EnergyLog.date))
-            .order_by(extract("dow", EnergyLog.date))
-            .all()
-        )
-
-        grouped_logs = [{"name": day, "qty": 0} for day in ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]]
-        for log in logs:
-            day_name = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"][int(log.day_of_week) - 1]  # Map day number to name
-            for entry in grouped_logs:
-                if entry["name"] == day_name:
-                    entry["qty"] = log.total_qty
-
-        return grouped_logs
+        return dashboard(db, current_user, resources=["energy"], sections=["by_week"])["energy"]["by_week"]
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error retrieving water logs: {str(e)}")
@@ -149,17 +186,21 @@ def delete_energy_log(
     current_user: User = Depends(get_current_user),
 ):
     try:
-        user = db.query(User).filter(User.username == current_user).first()
-        energy_log = db.query(EnergyLog).filter(EnergyLog.id == log_id, EnergyLog.user_id == user.id).first()
-        if not energy_log:
+        lock_log_changes(db, user_id_for(current_user))
+        deleted = delete_logs(db, "energy", EnergyLog.id == log_id, EnergyLog.user_id == user_id_for(current_user))
+        if not deleted:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Energy log not found or does not belong to the current user.",
             )
-        
-        db.delete(energy_log)
+
+        record_usage_changes(db, "energy", log_deltas("energy", deleted, -1))
         db.commit()
+        notify_logs_changed(current_user, "energy")
         return {"message": "Energy log deleted successfully."}
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -173,44 +214,7 @@ def get_energy_logs_summary(
     current_user: User = Depends(get_current_user),
 ):
     try:
-        user = db.query(User).filter(User.username == current_user).first()
-
-        today = datetime.now()
-        start_of_week = today - timedelta(days=today.weekday())
-        start_of_month = today.replace(day=1)
-
-        total_today = (
-            db.query(func.sum(EnergyLog.qty))
-            .filter(
-                EnergyLog.user_id == user.id,
-                func.date(EnergyLog.date) == today.date(),
-            )
-            .scalar() or 0
-        )
-        total_this_week = (
-            db.query(func.sum(EnergyLog.qty))
-            .filter(
-                EnergyLog.user_id == user.id,
-                EnergyLog.date >= start_of_week.date(),
-                EnergyLog.date <= today.date(),
-            )
-            .scalar() or 0
-        )
-        total_this_month = (
-            db.query(func.sum(EnergyLog.qty))
-            .filter(
-                EnergyLog.user_id == user.id,
-                EnergyLog.date >= start_of_month.date(),
-                EnergyLog.date <= today.date(),
-            )
-            .scalar() or 0
-        )
-
-        return {
-            "today": total_today,
-            "this_week": total_this_week,
-            "this_month": total_this_month,
-        }
+        return dashboard(db, current_user, resources=["energy"], sections=["summary"])["energy"]["summary"]
 
     except Exception as e:
         raise HTTPException(
@@ -222,23 +226,15 @@ def get_energy_logs_summary(
 @router.get("/export-energy-logs-excel")
 def export_energy_logs_excel(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     try:
-        user = db.query(User).filter(User.username == current_user).first()
-        # Fetch energy logs from the database
-        logs = db.query(EnergyLog).filter(EnergyLog.user_id == user.id).all()
+        # Fetch hot and archived energy logs from the database
+        logs = log_rows("energy", current_user)
+        logs = db.execute(select(logs).order_by(logs.c.date)).all()
 
         if not logs:
             raise HTTPException(status_code=404, detail="No water logs found.")
 
         data = [{"Date": log.date, "Quantity": log.qty, "Unit":log.unit.value} for log in logs]
-        df = pd.DataFrame(data)
-
-        excel_file = BytesIO()
-        df.to_excel(excel_file, index=False, engine="openpyxl")
-        excel_file.seek(0) 
-
-        return StreamingResponse(
-            excel_file, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={"Content-Disposition": "attachment; filename=energy_logs.xlsx"}
-        )
+        return excel_response(data, "energy_logs.xlsx")
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error exporting logs: {str(e)}")
@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from typing import List, Literal, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy.sql import func
 from fastapi import HTTPException
-from sqlalchemy import func
 from ..database import get_db
-from ..models import WaterLog, EnergyLog, User
+from ..models import User, WaterCategory
 from ..auth import get_current_user
+from ..analytics import dashboard, total_usage, DASHBOARD_SECTIONS
+from ..quantiles import compare
+from ..rollups import period_start, ALL_CATEGORIES
+from datetime import date, datetime
 
 router = APIRouter()
 
@@ -15,22 +18,10 @@ def get_usage_summary(
     current_user: User = Depends(get_current_user),
 ):
     try:
-        # Fetch user
-        user = db.query(User).filter(User.username == current_user).first()
-
-        # Query total water usage
-        total_water_used = (
-            db.query(func.sum(WaterLog.qty_litres))
-            .filter(WaterLog.user_id == user.id)
-            .scalar() or 0
-        )
-
-        # Query total energy usage
-        total_energy_used = (
-            db.query(func.sum(EnergyLog.qty))
-            .filter(EnergyLog.user_id == user.id)
-            .scalar() or 0
-        )
+        # Total water and energy usage across hot and archived logs
+        totals = total_usage(db, current_user)
+        total_water_used = totals["water"]
+        total_energy_used = totals["energy"]
 
         # Build the response
         return {
@@ -42,4 +33,65 @@ def get_usage_summary(
         raise HTTPException(
             status_code=400,
             detail=f"Error fetching usage summary: {str(e)}",
-        )
\ No newline at end of file
+        )
+
+
+@router.get("/dashboard", response_model=dict)
+def get_dashboard(
+    sections: List[Literal["summary", "by_week", "by_month"]] = Query(DASHBOARD_SECTIONS),
+    resources: List[Literal["water", "energy"]] = Query(["water", "energy"]),
+    pie: Optional[bool] = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Everything the dashboard renders in one call: summary totals, weekly and
+    monthly series for water and energy, and with pie=true the water
+    category breakdowns for the current week and month. Pick what to include
+    with repeated `sections` and `resources` parameters. All of it is computed
+    from one query.
+    """
+    try:
+        return dashboard(db, current_user, resources=resources, sections=sections, pie=pie)
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Error fetching dashboard: {str(e)}",
+        )
+
+
+@router.get("/compare", response_model=dict)
+def compare_usage(
+    resource: Literal["water", "energy"] = "water",
+    category: Optional[WaterCategory] = None,
+    period: Literal["day", "month"] = "month",
+    day: Optional[date] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    How the user's usage for the day or month containing `day` (default
+    today) compares with every other user's: their percentile and the
+    approximate quartiles/p90 of per-user totals. Pass `category` to compare
+    one water category. Answered from precomputed sketches, so the cost
+    doesn't grow with the number of users or logs.
+    """
+    if category is not None and resource != "water":
+        raise HTTPException(status_code=400, detail="Categories only apply to water.")
+    try:
+        user = db.query(User).filter(User.username == current_user).first()
+        start = period_start(day or datetime.now().date(), period)
+        category_key = category.name if category is not None else ALL_CATEGORIES
+        result = compare(db, user.id, resource, category_key, period, start)
+        return {
+            "resource": resource,
+            "category": category,
+            "period": period,
+            "period_start": start,
+            **result,
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Error comparing usage: {str(e)}",
+        )
@@ -0,0 +1,37 @@
+import logging
+
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+
+from ..database import engine
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+@router.get("/live", response_model=dict)
+def liveness():
+    """
+    The worker is up and serving requests.
+    """
+    return {"status": "ok"}
+
+
+@router.get("/ready", response_model=dict)
+def readiness():
+    """
+    The worker can reach the database. Answers 503 otherwise, so load
+    balancers stop routing to it.
+    """
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    except Exception:
+        # The driver's message can name hosts and users; it goes to the log only
+        logger.exception("Readiness check failed")
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "unavailable", "detail": "Database unreachable."},
+        )
+    return {"status": "ready"}
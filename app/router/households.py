@@ -0,0 +1,250 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from typing import List, Literal, Optional
+
+from ..database import get_db
+from ..models import Household, HouseholdMember, User
+from ..schemas import HouseholdCreate, HouseholdJoin, HouseholdResponse
+from ..auth import get_current_user
+from ..exports import excel_response
+from ..analytics import DASHBOARD_SECTIONS
+from ..households import (
+    add_member,
+    create_household,
+    household_dashboard,
+    household_log_rows,
+    member_breakdown,
+    membership,
+    remove_member,
+)
+
+router = APIRouter()
+
+
+def get_user(db: Session, username: str) -> User:
+    user = db.query(User).filter(User.username == username).first()
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found.")
+    return user
+
+
+def get_membership(db: Session, username: str) -> HouseholdMember:
+    member = membership(db, get_user(db, username).id)
+    if member is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="You don't belong to a household.")
+    return member
+
+
+def household_response(db: Session, household_id: int) -> dict:
+    household = db.get(Household, household_id)
+    members = db.execute(
+        select(User.username, HouseholdMember.role)
+        .join(User, User.id == HouseholdMember.user_id)
+        .where(HouseholdMember.household_id == household_id)
+        .order_by(HouseholdMember.joined_at, User.username)
+    ).mappings().all()
+    return {"id": household.id, "name": household.name, "invite_code": household.invite_code, "members": members}
+
+
+@router.post("/", response_model=HouseholdResponse, status_code=status.HTTP_201_CREATED)
+def create_new_household(
+    household: HouseholdCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Create a household owned by the user. Others join it with the returned
+    invite_code.
+    """
+    try:
+        user = get_user(db, current_user)
+        created = create_household(db, user.id, household.name)
+        db.commit()
+        return household_response(db, created.id)
+    except HTTPException:
+        db.rollback()
+        raise
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error creating household: {str(e)}")
+
+
+@router.get("/", response_model=HouseholdResponse)
+def get_household(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    The user's household and its members.
+    """
+    try:
+        return household_response(db, get_membership(db, current_user).household_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error retrieving household: {str(e)}")
+
+
+@router.post("/join", response_model=HouseholdResponse)
+def join_household(
+    invite: HouseholdJoin,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Join the household with the given invite code. The user's usage,
+    past and future, counts towards the household's until they leave.
+    """
+    try:
+        user = get_user(db, current_user)
+        household_id = db.execute(select(Household.id).where(Household.invite_code == invite.invite_code)).scalar()
+        if household_id is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invalid invite code.")
+        add_member(db, household_id, user.id)
+        db.commit()
+        return household_response(db, household_id)
+    except HTTPException:
+        db.rollback()
+        raise
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error joining household: {str(e)}")
+
+
+@router.post("/leave", status_code=status.HTTP_204_NO_CONTENT)
+def leave_household(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Leave the user's household, taking their usage out of its totals.
+    """
+    try:
+        member = get_membership(db, current_user)
+        remove_member(db, member.household_id, member.user_id)
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error leaving household: {str(e)}")
+
+
+@router.delete("/members/{username}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_household_member(
+    username: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Remove a member from the household. Owners only.
+    """
+    try:
+        owner = get_membership(db, current_user)
+        if owner.role != "owner":
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only the household owner can remove members.")
+        user_id = db.execute(select(User.id).where(User.username == username)).scalar()
+        if user_id is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Member not found.")
+        remove_member(db, owner.household_id, user_id)
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    except LookupError as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error removing household member: {str(e)}")
+
+
+@router.get("/summary", response_model=dict)
+def get_household_summary(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Household water and energy totals for today, this week and this month,
+    and each member's share of them.
+    """
+    try:
+        household_id = get_membership(db, current_user).household_id
+        totals = household_dashboard(db, household_id, sections=["summary"])
+        return {
+            "water": totals["water"]["summary"],
+            "energy": totals["energy"]["summary"],
+            "members": member_breakdown(db, household_id),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error fetching household summary: {str(e)}")
+
+
+@router.get("/dashboard", response_model=dict)
+def get_household_dashboard(
+    sections: List[Literal["summary", "by_week", "by_month"]] = Query(DASHBOARD_SECTIONS),
+    resources: List[Literal["water", "energy"]] = Query(["water", "energy"]),
+    pie: Optional[bool] = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    /general/dashboard for the whole household: summary, weekly and monthly
+    series and, with pie=true, water category breakdowns, all read from
+    the household's running totals in one query.
+    """
+    try:
+        household_id = get_membership(db, current_user).household_id
+        return household_dashboard(db, household_id, resources=resources, sections=sections, pie=pie)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error fetching household dashboard: {str(e)}")
+
+
+@router.get("/export-water-logs-excel")
+def export_household_water_logs_excel(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    try:
+        household_id = get_membership(db, current_user).household_id
+        logs = household_log_rows("water", household_id, ["qty", "unit", "category", "date"])
+        logs = db.execute(select(logs).order_by(logs.c.date, logs.c.username)).all()
+
+        if not logs:
+            raise HTTPException(status_code=404, detail="No water logs found.")
+
+        data = [{"Date": log.date, "Member": log.username, "Quantity": log.qty, "Unit": log.unit.value, "Category": log.category.value} for log in logs]
+        return excel_response(data, "household_water_logs.xlsx")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error exporting logs: {str(e)}")
+
+
+@router.get("/export-energy-logs-excel")
+def export_household_energy_logs_excel(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    try:
+        household_id = get_membership(db, current_user).household_id
+        logs = household_log_rows("energy", household_id, ["qty", "unit", "date"])
+        logs = db.execute(select(logs).order_by(logs.c.date, logs.c.username)).all()
+
+        if not logs:
+            raise HTTPException(status_code=404, detail="No energy logs found.")
+
+        data = [{"Date": log.date, "Member": log.username, "Quantity": log.qty, "Unit": log.unit.value} for log in logs]
+        return excel_response(data, "household_energy_logs.xlsx")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error exporting logs: {str(e)}")
@@ -0,0 +1,65 @@
+import json
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from ..analytics import live_snapshot
+from ..auth import get_stream_user
+from ..config import settings
+from ..database import SessionLocal
+from ..events import get_broker, shutting_down, user_channel
+from ..models import User
+
+router = APIRouter()
+
+
+def _load_snapshot(username: str) -> dict:
+    db = SessionLocal()
+    try:
+        return live_snapshot(db, username)
+    finally:
+        db.close()
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.get("/dashboard")
+async def stream_dashboard(
+    request: Request,
+    current_user: User = Depends(get_stream_user),
+):
+    """
+    Server-Sent Events stream of the user's water/energy summary totals and
+    weekly series. A `dashboard` event is sent on connect and again whenever
+    one of the user's logs is created, updated or deleted, replacing polling
+    of /summary and /logs-by-week. Authenticate with the usual bearer
+    header, or with ?access_token= from a browser's EventSource, which
+    can't send headers. The stream ends when the server shuts down;
+    EventSource clients reconnect on their own.
+    """
+    async def events():
+        # Subscribed here, not in the endpoint, so a client gone before the
+        # body is iterated never leaves a subscription behind
+        subscription = get_broker().subscribe(user_channel(current_user))
+        try:
+            yield _sse("dashboard", await run_in_threadpool(_load_snapshot, current_user))
+            while not shutting_down() and not await request.is_disconnected():
+                change = await subscription.get(timeout=settings.LIVE_HEARTBEAT_SECONDS)
+                if shutting_down():
+                    break
+                if change is None:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse("dashboard", await run_in_threadpool(_load_snapshot, current_user))
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,97 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from datetime import datetime, timedelta
+from typing import List, Literal, Optional
+
+from ..database import get_db
+from ..models import MeterDevice, User
+from ..schemas import MeterReadingBatch, MeterIngestResult, MeterDeviceResponse
+from ..auth import get_current_user
+from ..config import settings
+from ..events import notify_logs_changed
+from ..meters import get_or_create_device, ingest_readings, usage_series
+from ..queries import user_id_for
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[MeterDeviceResponse])
+def get_meter_devices(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    List the user's metering devices.
+    """
+    try:
+        return db.query(MeterDevice).filter(MeterDevice.user_id == user_id_for(current_user)).order_by(MeterDevice.name).all()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error retrieving meter devices: {str(e)}")
+
+
+@router.post("/{device}", response_model=MeterIngestResult)
+def ingest_meter_readings(
+    device: str,
+    batch: MeterReadingBatch,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Ingest cumulative kWh readings for a device as [[timestamp, kwh], ...].
+    The device is registered on first use. Hourly usage and the daily
+    energy log for each affected day are updated in the same transaction.
+    """
+    if len(batch.readings) > settings.METER_MAX_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.METER_MAX_BATCH} readings per request.",
+        )
+    try:
+        user = db.query(User).filter(User.username == current_user).first()
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found.",
+            )
+        device_id = get_or_create_device(db, user.id, device)
+        stored = ingest_readings(db, user.id, device_id, batch.readings)
+        db.commit()
+        if stored:
+            notify_logs_changed(current_user, "energy")
+        return {"device": device, "received": len(batch.readings), "stored": stored}
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error ingesting meter readings: {str(e)}")
+
+
+@router.get("/{device}", response_model=list)
+def get_meter_usage(
+    device: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: Literal["raw", "hour", "day"] = "hour",
+    limit: int = Query(5000, ge=1, le=100000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Readings (resolution=raw) or kWh used per hour/day for a device between
+    start and end. Defaults to the last 24 hours.
+    """
+    try:
+        device_id = db.execute(
+            select(MeterDevice.id).where(MeterDevice.user_id == user_id_for(current_user), MeterDevice.name == device)
+        ).scalar()
+        if device_id is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Meter device not found.")
+        end = end or datetime.utcnow()
+        start = start or end - timedelta(days=1)
+        return usage_series(db, device_id, start, end, resolution, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error retrieving meter usage: {str(e)}")
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from ..database import get_db
+from ..models import User
+from ..schemas import SyncResponse
+from ..auth import get_current_user
+from ..sync import changes_since, parse_token
+
+router = APIRouter()
+
+
+@router.get("/", response_model=SyncResponse)
+def sync_logs(
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Water and energy logs created, changed or deleted since the `since`
+    token. Omit `since` for a full download, archived logs included. Store
+    the returned token and
+    pass it on the next call; while `has_more` is true, call again straight
+    away to fetch the rest.
+    """
+    try:
+        since_seq, archive_after = parse_token(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token.")
+    try:
+        return changes_since(db, current_user, since_seq, limit, archive_after)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error syncing logs: {str(e)}")
@@ -1,18 +1,19 @@
-import pandas as pd
-import calendar
-
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from sqlalchemy import extract, func, desc
+from sqlalchemy import desc, case, select
 from typing import Optional
-from fastapi.responses import StreamingResponse
-from io import BytesIO
 
 from ..database import get_db
-from ..models import WaterLog, User, WaterUnit
-from ..schemas import WaterLogCreate, WaterLogResponse, WaterLogList, GenSummaryResponse
+from ..models import WaterLog, User, WATER_UNIT_LITRES
+from ..schemas import WaterLogCreate, WaterLogBulkUpdate, WaterLogResponse, WaterLogList, GenSummaryResponse, LogBulkDelete, BulkResult
+from ..queries import user_id_for, id_in, bulk_delete_filters, update_logs
 from ..auth import get_current_user
+from ..exports import excel_response
+from ..events import notify_logs_changed
+from ..sync import delete_logs, lock_log_changes
+from ..rollups import record_usage_changes, log_deltas
+from ..archive import log_rows
+from ..analytics import dashboard
 
 router = APIRouter()
 
@@ -22,7 +23,7 @@ def get_all_water_logs(
     current_user: User = Depends(get_current_user)
 ):
     """
-    Fetch all water logs for the authenticated user.
+    Fetch all water logs for the authenticated user, including archived ones.
     """
     try:
         user = db.query(User).filter(User.username == current_user).first()
@@ -31,7 +32,8 @@ def get_all_water_logs(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="User not found.",
             )
-        water_logs = db.query(WaterLog).filter(WaterLog.user_id == user.id).order_by(desc(WaterLog.date)).all()
+        logs = log_rows("water", current_user)
+        water_logs = db.execute(select(logs).order_by(desc(logs.c.date))).mappings().all()
         return {'result':water_logs}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error retrieving water logs: {str(e)}")
@@ -51,23 +53,19 @@ def create_water_log(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="User not found.",
             )
-        if water_log.unit==WaterUnit.BUCKET:
-            qty_litres = water_log.qty*19
-        elif water_log.unit==WaterUnit.CUP:
-            qty_litres = water_log.qty*0.236
-        else:
-            qty_litres = water_log.qty
-        
         db_log = WaterLog(
             user_id=user.id,
             date=water_log.date,
             qty=water_log.qty,
-            qty_litres=qty_litres,
+            qty_litres=water_log.qty * WATER_UNIT_LITRES[water_log.unit],
             unit=water_log.unit,
             category=water_log.category
         )
+        lock_log_changes(db, user.id)
         db.add(db_log)
+        record_usage_changes(db, "water", log_deltas("water", [db_log]))
         db.commit()
+        notify_logs_changed(current_user, "water")
         db.refresh(db_log)
         return db_log
     except Exception as e:
@@ -75,60 +73,115 @@ def create_water_log(
         raise HTTPException(status_code=400, detail=f"Error creating water log: {str(e)}")
 
 
-@router.get("/logs-by-month", response_model=list)
-def get_water_logs_grouped_by_month(
-    pie: Optional[bool] = False,
+def _update_values(changes: dict) -> dict:
+    """
+    SET clause for a water log update. qty_litres is recomputed whenever qty
+    or unit changes; when only qty is given the factor is taken from each
+    row's stored unit inside the statement.
+    """
+    values = dict(changes)
+    if "qty" in values or "unit" in values:
+        qty = values.get("qty", WaterLog.qty)
+        if "unit" in values:
+            values["qty_litres"] = qty * WATER_UNIT_LITRES[values["unit"]]
+        else:
+            values["qty_litres"] = qty * case(*[(WaterLog.unit == unit, factor) for unit, factor in WATER_UNIT_LITRES.items()])
+    return values
+
+
+@router.put("/{log_id}", response_model=WaterLogResponse)
+def update_water_log(
+    log_id: int,
+    water_log: WaterLogCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user) ,
+    current_user: User = Depends(get_current_user),
 ):
+    """
+    Replace a single water log in one UPDATE ... RETURNING statement.
+    """
     try:
-        result = []
+        lock_log_changes(db, user_id_for(current_user))
+        rows = update_logs(db, WaterLog, _update_values(water_log.model_dump()), WaterLog.id == log_id, WaterLog.user_id == user_id_for(current_user))
+        if not rows:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Water log not found or does not belong to the current user.",
+            )
+        record_usage_changes(db, "water", log_deltas("water", rows, -1, "old_") + log_deltas("water", rows))
+        updated = dict(rows[0]._mapping)
+        db.commit()
+        notify_logs_changed(current_user, "water")
+        return updated
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error updating water log: {str(e)}")
 
-        user = db.query(User).filter(User.username == current_user).first()
-        today = datetime.now()
-        current_year = datetime.now().year
 
+@router.patch("/", response_model=BulkResult)
+def bulk_update_water_logs(
+    payload: WaterLogBulkUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Apply the same partial update to a list of water logs in one statement.
+    Ids that don't exist or belong to another user are skipped.
+    """
+    changes = payload.model_dump(exclude={"ids"}, exclude_unset=True, exclude_none=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="No fields to update.")
+    if not payload.ids:
+        return {"affected": 0, "ids": []}
+    try:
+        lock_log_changes(db, user_id_for(current_user))
+        rows = update_logs(db, WaterLog, _update_values(changes), WaterLog.user_id == user_id_for(current_user), id_in(WaterLog.id, payload.ids))
+        record_usage_changes(db, "water", log_deltas("water", rows, -1, "old_") + log_deltas("water", rows))
+        ids = [row.id for row in rows]
+        db.commit()
+        notify_logs_changed(current_user, "water")
+        return {"affected": len(ids), "ids": ids}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error updating water logs: {str(e)}")
 
-        if pie:
-            current_month = today.month
-            logs = (
-                db.query(
-                    WaterLog.category.label("category"),
-                    func.sum(WaterLog.qty_litres).label("total_qty")
-                )
-                .filter(WaterLog.user_id == user.id)
-                .filter(extract("year", WaterLog.date) == current_year)
-                .filter(extract("month", WaterLog.date) == current_month)
-                .group_by(WaterLog.category)
-                .all()
-            )
-            grouped_logs = {}
-            for log in logs:
-                result.append({'category':log.category, 'total_qty': log.total_qty})
-            return result
 
-        else:
-            logs = (
-                db.query(
-                    extract("month", WaterLog.date).label("month"),
-                    func.sum(WaterLog.qty_litres).label("total_qty"),
-                    func.count(WaterLog.id).label("log_count")
-                )
-                .filter(WaterLog.user_id == user.id)
-                .filter(extract("year", WaterLog.date) == current_year)
-                .group_by(extract("month", WaterLog.date))
-                .order_by(extract("month", WaterLog.date))
-                .all()
-            )
+@router.delete("/", response_model=BulkResult)
+def bulk_delete_water_logs(
+    criteria: LogBulkDelete,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Delete water logs by id list and/or date range in one statement.
+    """
+    if criteria.ids is None and criteria.start_date is None and criteria.end_date is None:
+        raise HTTPException(status_code=400, detail="Provide ids or a date range to delete.")
+    try:
+        lock_log_changes(db, user_id_for(current_user))
+        rows = delete_logs(db, "water", *bulk_delete_filters(WaterLog, current_user, criteria))
+        record_usage_changes(db, "water", log_deltas("water", rows, -1))
+        ids = [row.id for row in rows]
+        db.commit()
+        notify_logs_changed(current_user, "water")
+        return {"affected": len(ids), "ids": ids}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error deleting water logs: {str(e)}")
 
-            grouped_logs = [{"name": calendar.month_name[i][:3], "qty": 0} for i in range(1, 13)]
 
-            for log in logs:
-                month_name = calendar.month_name[int(log.month)][:3]
-                for entry in grouped_logs:
-                    if entry["name"] == month_name:
-                        entry["qty"] = log.total_qty
-            return grouped_logs
+@router.get("/logs-by-month", response_model=list)
+def get_water_logs_grouped_by_month(
+    pie: Optional[bool] = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user) ,
+):
+    try:
+        if pie:
+            return dashboard(db, current_user, resources=["water"], sections=[], pie=True)["water"]["pie_month"]
+        return dashboard(db, current_user, resources=["water"], sections=["by_month"])["water"]["by_month"]
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error retrieving water logs: {str(e)}")
@@ -141,55 +194,9 @@ def get_water_logs_grouped_by_current_week(
     current_user: User = Depends(get_current_user),
 ):
     try:
-        result=[]
-        user = db.query(User).filter(User.username == current_user).first()
-
-        today = datetime.today()
-        start_of_week = today - timedelta(days=today.weekday())
-        end_of_week = start_of_week + timedelta(days=6)
-        print(start_of_week.date(), end_of_week.date())
-
-        # logs = db.query(WaterLog).filter(WaterLog.date == datetime(2025, 2, 3).date()).all()
-
         if pie:
-            logs = (
-                db.query(
-                    WaterLog.category.label("category"),
-                    func.sum(WaterLog.qty_litres).label("total_qty")
-                )
-                .filter(WaterLog.user_id == user.id)
-                .filter(WaterLog.date >= start_of_week.date())
-                .filter(WaterLog.date <= end_of_week.date())
-                .group_by(WaterLog.category)
-                .all()
-            )
-
-            grouped_logs = {}
-            for log in logs:
-                result.append({'category':log.category, 'total_qty': log.total_qty})
-            return result
-        else:
-            logs = (
-                db.query(
-                    extract("dow", WaterLog.date).label("day_of_week"),
-                    func.sum(WaterLog.qty_litres).label("total_qty")
-                )
-                .filter(WaterLog.user_id == user.id)
-                .filter(WaterLog.date >= start_of_week.date())
-                .filter(WaterLog.date <= end_of_week.date())
-                .group_by(extract("dow", WaterLog.date))
-                .order_by(extract("dow", WaterLog.date))
-                .all()
-            )
-
-            grouped_logs = [{"name": day, "qty": 0} for day in ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]]
-
-            for log in logs:
-                day_name = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"][int(log.day_of_week) - 1]
-                for entry in grouped_logs:
-                    if entry["name"] == day_name:
-                        entry["qty"] = log.total_qty
-            return grouped_logs
+            return dashboard(db, current_user, resources=["water"], sections=[], pie=True)["water"]["pie_week"]
+        return dashboard(db, current_user, resources=["water"], sections=["by_week"])["water"]["by_week"]
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error retrieving water logs: {str(e)}")
@@ -202,18 +209,21 @@ def delete_water_log(
     current_user: User = Depends(get_current_user),
 ):
     try:
-        user = db.query(User).filter(User.username == current_user).first()
-
-        water_log = db.query(WaterLog).filter(WaterLog.id == log_id, WaterLog.user_id == user.id).first()
-        if not water_log:
+        lock_log_changes(db, user_id_for(current_user))
+        deleted = delete_logs(db, "water", WaterLog.id == log_id, WaterLog.user_id == user_id_for(current_user))
+        if not deleted:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Water log not found or does not belong to the current user.",
             )
-        
-        db.delete(water_log)
+
+        record_usage_changes(db, "water", log_deltas("water", deleted, -1))
         db.commit()
+        notify_logs_changed(current_user, "water")
         return {"message": "Water log deleted successfully."}
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -228,44 +238,7 @@ def get_water_logs_summary(
     current_user: User = Depends(get_current_user),
 ):
     try:
-        user = db.query(User).filter(User.username == current_user).first()
-
-        today = datetime.now()
-        start_of_week = today - timedelta(days=today.weekday())
-        start_of_month = today.replace(day=1)
-
-        total_today = (
-            db.query(func.sum(WaterLog.qty_litres))
-            .filter(
-                WaterLog.user_id == user.id,
-                func.date(WaterLog.date) == today.date(),
-            )
-            .scalar() or 0
-        )
-        total_this_week = (
-            db.query(func.sum(WaterLog.qty_litres))
-            .filter(
-                WaterLog.user_id == user.id,
-                WaterLog.date >= start_of_week.date(),
-                WaterLog.date <= today.date(),
-            )
-            .scalar() or 0
-        )
-        total_this_month = (
-            db.query(func.sum(WaterLog.qty_litres))
-            .filter(
-                WaterLog.user_id == user.id,
-                WaterLog.date >= start_of_month.date(),
-                WaterLog.date <= today.date(),
-            )
-            .scalar() or 0
-        )
-
-        return {
-            "today": total_today,
-            "this_week": total_this_week,
-            "this_month": total_this_month,
-        }
+        return dashboard(db, current_user, resources=["water"], sections=["summary"])["water"]["summary"]
 
     except Exception as e:
         raise HTTPException(
@@ -277,22 +250,14 @@ def get_water_logs_summary(
 @router.get("/export-water-logs-excel")
 def export_water_logs_excel(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     try:
-        user = db.query(User).filter(User.username == current_user).first()
-        logs = db.query(WaterLog).filter(WaterLog.user_id == user.id).all()
+        logs = log_rows("water", current_user)
+        logs = db.execute(select(logs).order_by(logs.c.date)).all()
 
         if not logs:
             raise HTTPException(status_code=404, detail="No water logs found.")
 
         data = [{"Date": log.date, "Quantity": log.qty, "Unit":log.unit.value, "Category": log.category.value} for log in logs]
-        df = pd.DataFrame(data)
-
-        excel_file = BytesIO()
-        df.to_excel(excel_file, index=False, engine="openpyxl")
-        excel_file.seek(0)
-
-        return StreamingResponse(
-            excel_file, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={"Content-Disposition": "attachment; filename=water_logs.xlsx"}
-        )
+        return excel_response(data, "water_logs.xlsx")
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error exporting logs: {str(e)}")
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal, Optional, Tuple
+from datetime import datetime
 from datetime import date as date_o
 from .models import WaterUnit, WaterCategory, EnergyUnit
 
@@ -50,6 +51,16 @@ class WaterLogResponse(BaseModel):
     date: date_o
 
 
+class WaterLogUpdate(BaseModel):
+    qty: Optional[float] = None
+    unit: Optional[WaterUnit] = None
+    category: Optional[WaterCategory] = None
+    date: Optional[date_o] = None
+
+class WaterLogBulkUpdate(WaterLogUpdate):
+    ids: List[int]
+
+
 class EnergyLogCreate(BaseModel):
     qty: float
     unit: EnergyUnit
@@ -61,6 +72,24 @@ class EnergyLogResponse(BaseModel):
     unit: EnergyUnit
     date: date_o
 
+class EnergyLogUpdate(BaseModel):
+    qty: Optional[float] = None
+    unit: Optional[EnergyUnit] = None
+    date: Optional[date_o] = None
+
+class EnergyLogBulkUpdate(EnergyLogUpdate):
+    ids: List[int]
+
+
+class LogBulkDelete(BaseModel):
+    ids: Optional[List[int]] = None
+    start_date: Optional[date_o] = None
+    end_date: Optional[date_o] = None
+
+class BulkResult(BaseModel):
+    affected: int
+    ids: List[int]
+
 
 class EnergyLogList(BaseModel):
     result:List[EnergyLogResponse]
@@ -74,3 +103,83 @@ class GenSummaryResponse(BaseModel):
     today:float
     this_week:float
     this_month:float
+
+
+class WaterLogChanges(BaseModel):
+    changed: List[WaterLogResponse]
+    deleted: List[int]
+
+class EnergyLogChanges(BaseModel):
+    changed: List[EnergyLogResponse]
+    deleted: List[int]
+
+class SyncResponse(BaseModel):
+    token: str
+    has_more: bool
+    water: WaterLogChanges
+    energy: EnergyLogChanges
+
+
+class MeterReadingBatch(BaseModel):
+    # [[timestamp, cumulative kWh], ...]
+    readings: List[Tuple[datetime, float]]
+
+class MeterIngestResult(BaseModel):
+    device: str
+    received: int
+    stored: int
+
+class MeterDeviceResponse(BaseModel):
+    id: int
+    name: str
+
+
+class BudgetCreate(BaseModel):
+    resource: Literal["water", "energy"]
+    # Water only; omit for a budget over all categories
+    category: Optional[WaterCategory] = None
+    period: Literal["day", "week", "month"]
+    limit_qty: float
+
+class BudgetResponse(BaseModel):
+    id: int
+    resource: str
+    category: Optional[WaterCategory]
+    period: str
+    limit_qty: float
+    period_start: date_o
+    used: float
+    exceeded: bool
+
+class BudgetAlertResponse(BaseModel):
+    id: int
+    budget_id: int
+    period_start: date_o
+    total: float
+    limit_qty: float
+    created_at: datetime
+    delivered_at: Optional[datetime]
+
+
+class HouseholdCreate(BaseModel):
+    name: str
+
+class HouseholdJoin(BaseModel):
+    invite_code: str
+
+class HouseholdMemberResponse(BaseModel):
+    username: str
+    role: str
+
+class HouseholdResponse(BaseModel):
+    id: int
+    name: str
+    invite_code: str
+    members: List[HouseholdMemberResponse]
+
+
+class ProfileRequest(BaseModel):
+    # Route path template, e.g. "/water-logs/logs-by-month"
+    path: str
+    method: Optional[str] = None
+    count: int = 10
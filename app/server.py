@@ -0,0 +1,123 @@
+"""
+Production server.
+
+Runs the app under gunicorn with uvicorn workers:
+
+    python -m app.server --workers 4
+
+- The app is imported once in the master before forking (preload), so
+  workers share its modules copy-on-write instead of each importing them.
+- Each worker disposes of the SQLAlchemy pool it inherited, so no database
+  connection is ever shared across processes.
+- On SIGTERM, workers stop accepting connections, end live dashboard
+  streams, and let in-flight requests (e.g. exports) finish for up to
+  SHUTDOWN_TIMEOUT seconds.
+- SERVER_LOOP/SERVER_HTTP pick the event loop and HTTP parser; "auto" uses
+  uvloop and httptools when they're installed.
+
+Point load balancer health checks at /health/ready.
+"""
+import argparse
+import logging
+import os
+
+from gunicorn.app.base import BaseApplication
+
+try:
+    from uvicorn_worker import UvicornWorker
+except ImportError:
+    # Deprecated in favour of the uvicorn-worker package, but still shipped
+    from uvicorn.workers import UvicornWorker
+
+from .config import settings
+from .events import LocalBroker, broker_class
+
+logger = logging.getLogger(__name__)
+
+
+class Worker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": settings.SERVER_LOOP,
+        "http": settings.SERVER_HTTP,
+        "timeout_graceful_shutdown": settings.SHUTDOWN_TIMEOUT,
+    }
+
+
+def default_workers() -> int:
+    # CPUs this process may run on, which can be fewer than the machine has
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class StripQueryString(logging.Filter):
+    """
+    Drops query strings from uvicorn's access log lines, since they can
+    carry access tokens (see /live/dashboard).
+    """
+
+    def filter(self, record):
+        if isinstance(record.args, tuple) and len(record.args) == 5:
+            client, method, path, version, status = record.args
+            record.args = (client, method, path.split("?", 1)[0], version, status)
+        return True
+
+
+def post_fork(server, worker):
+    from .database import engine
+
+    logging.getLogger("uvicorn.access").addFilter(StripQueryString())
+
+    # Drop the pool inherited from the master without closing its sockets,
+    # which the master (and other workers) would otherwise lose too
+    engine.dispose(close=False)
+
+
+class Server(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from .main import app
+
+        return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API with gunicorn and uvicorn workers.")
+    parser.add_argument("--bind", default=f"{settings.HOST}:{settings.PORT}")
+    parser.add_argument("--workers", type=int, default=settings.WEB_CONCURRENCY or default_workers())
+    parser.add_argument("--loop", choices=["auto", "asyncio", "uvloop"], default=settings.SERVER_LOOP)
+    parser.add_argument("--http", choices=["auto", "h11", "httptools"], default=settings.SERVER_HTTP)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    if args.workers > 1 and issubclass(broker_class(), LocalBroker):
+        logger.warning(
+            "EVENT_BROKER is %s with %d workers: live dashboards only see writes handled by their own worker. "
+            "Set EVENT_BROKER=app.events.PostgresBroker.",
+            settings.EVENT_BROKER, args.workers,
+        )
+
+    worker_class = type("Worker", (Worker,), {"CONFIG_KWARGS": {**Worker.CONFIG_KWARGS, "loop": args.loop, "http": args.http}})
+    Server({
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": worker_class,
+        "preload_app": True,
+        "post_fork": post_fork,
+        # Leave uvicorn's own graceful shutdown time to complete
+        "graceful_timeout": settings.SHUTDOWN_TIMEOUT + 5,
+        "forwarded_allow_ips": settings.FORWARDED_ALLOW_IPS,
+        "loglevel": args.log_level,
+        "accesslog": "-",
+    }).run()
+
+
+if __name__ == "__main__":
+    main()
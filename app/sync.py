@@ -0,0 +1,208 @@
+"""
+Delta sync.
+
+Logs carry a change_seq drawn from log_change_seq on every insert and
+update, and deletes leave tombstones numbered from the same sequence, so a
+client's sync token is the highest sequence number it has seen.
+
+A full download (no token, or 0) also returns the user's archived logs: once
+the hot changes are exhausted, the archive tables are paged through by id,
+the token carrying the archive position as "<seq>:<water id>:<energy id>"
+until they're done. Hot changes come first so a log archived mid-download
+is still found in the archive. Archiving doesn't leave tombstones, so
+incremental syncs keep the archived logs a client already has.
+
+Sequence numbers are handed out when a statement runs, not when its
+transaction commits, so two writers could otherwise commit out of order
+and a sync in between would hand out a token past the later one's
+uncommitted change. Every write path calls lock_log_changes() first, which
+serializes a user's log writes on their users row: a user's changes then
+commit in change_seq order, and a committed change_seq implies every lower
+one of that user is committed too.
+
+Adding the column with its server default numbers existing logs. If it was
+added without one, number the old rows once with:
+
+    python -m app.sync backfill
+"""
+import argparse
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from .models import LogTombstone, User, LOG_MODELS, ARCHIVE_MODELS, log_change_seq
+from .queries import user_id_for
+
+
+def lock_log_changes(db: Session, user_id):
+    """
+    Take the user's users row FOR NO KEY UPDATE until the transaction ends.
+    Call before anything that draws from log_change_seq for that user.
+    user_id may be a scalar subquery such as user_id_for(username).
+    """
+    db.execute(select(User.id).where(User.id == user_id).with_for_update(key_share=True))
+
+
+def delete_logs(db: Session, resource: str, *filters) -> list:
+    """
+    DELETE ... RETURNING for log rows matching filters, leaving a tombstone
+    for each deleted row in the same transaction. Returns the deleted rows.
+    """
+    model = LOG_MODELS[resource]
+    rows = db.execute(
+        delete(model)
+        .where(*filters)
+        .returning(*model.__table__.c)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if rows:
+        db.execute(
+            insert(LogTombstone),
+            [{"user_id": row.user_id, "resource": resource, "log_id": row.id} for row in rows],
+        )
+    return rows
+
+
+def parse_token(token: str):
+    """
+    Sync tokens are the last change sequence number a client has seen,
+    followed during a full download by the last archived water and energy
+    log ids sent. Returns (seq, {resource: last archived id}), the latter
+    None outside a full download.
+    """
+    parts = [int(part) for part in (token or "0").split(":")]
+    if any(part < 0 for part in parts):
+        raise ValueError("negative sync token")
+    if parts == [0]:
+        # Nothing seen yet: a full download
+        return 0, {resource: 0 for resource in ARCHIVE_MODELS}
+    if len(parts) == 1:
+        return parts[0], None
+    if len(parts) != 1 + len(ARCHIVE_MODELS):
+        raise ValueError("malformed sync token")
+    return parts[0], dict(zip(ARCHIVE_MODELS, parts[1:]))
+
+
+def changes_since(db: Session, username: str, since: int, limit: int, archive_after: dict = None) -> dict:
+    """
+    Logs created or updated, and tombstones recorded, after change sequence
+    `since`, oldest first. Each source reads at most limit + 1 rows from its
+    (user_id, change_seq) index; when any of them is truncated, every source
+    is cut at the same sequence number so the returned token never skips a
+    change, and has_more tells the client to call again. Writers hold
+    lock_log_changes() while numbering, so no change below the token can
+    still be in flight.
+
+    With archive_after (during a full download), calls that exhaust the hot
+    changes also return up to limit archived logs per resource with ids
+    above archive_after's, from the archive tables' primary keys.
+    """
+    user_id = user_id_for(username)
+    sources = {}
+    for resource, model in LOG_MODELS.items():
+        sources[resource] = db.execute(
+            select(model)
+            .where(model.user_id == user_id, model.change_seq > since)
+            .order_by(model.change_seq)
+            .limit(limit + 1)
+        ).scalars().all()
+    # A client starting from scratch has nothing to delete
+    sources["deleted"] = []
+    if since:
+        sources["deleted"] = db.execute(
+            select(LogTombstone)
+            .where(LogTombstone.user_id == user_id, LogTombstone.change_seq > since)
+            .order_by(LogTombstone.change_seq)
+            .limit(limit + 1)
+        ).scalars().all()
+
+    truncated = [rows[limit - 1].change_seq for rows in sources.values() if len(rows) > limit]
+    cutoff = min(truncated) if truncated else None
+    if cutoff is not None:
+        sources = {key: [row for row in rows if row.change_seq <= cutoff] for key, rows in sources.items()}
+
+    seen = [row.change_seq for rows in sources.values() for row in rows]
+    token = cutoff if cutoff is not None else max(seen, default=since)
+
+    archived = {resource: [] for resource in ARCHIVE_MODELS}
+    archive_more = False
+    if archive_after is not None and cutoff is None:
+        archive_after = dict(archive_after)
+        for resource, archive in ARCHIVE_MODELS.items():
+            rows = db.execute(
+                select(archive)
+                .where(archive.user_id == user_id, archive.id > archive_after[resource])
+                .order_by(archive.id)
+                .limit(limit + 1)
+            ).scalars().all()
+            if len(rows) > limit:
+                rows, archive_more = rows[:limit], True
+            if rows:
+                archive_after[resource] = rows[-1].id
+            archived[resource] = rows
+
+    has_more = cutoff is not None or archive_more
+    if archive_after is not None and has_more:
+        token = ":".join(str(part) for part in [token, *archive_after.values()])
+
+    result = {
+        "token": str(token),
+        "has_more": has_more,
+    }
+    for resource in LOG_MODELS:
+        result[resource] = {
+            "changed": sources[resource] + archived[resource],
+            "deleted": [row.log_id for row in sources["deleted"] if row.resource == resource],
+        }
+    return result
+
+
+def backfill_change_seq(db: Session) -> dict:
+    """
+    Number every log without a change sequence number, in id order, from a
+    block of log_change_seq reserved with setval(). Meant to run as part of
+    the migration, with writes stopped: a nextval() from another session
+    between the reservation and the update could land inside the block.
+    Returns the number of rows numbered per resource.
+    """
+    counts = {}
+    for resource, model in LOG_MODELS.items():
+        count = db.execute(select(func.count()).where(model.change_seq.is_(None))).scalar()
+        counts[resource] = count
+        if not count:
+            continue
+        # Reserve count values; the block ends at the returned value
+        last = db.execute(select(func.setval(log_change_seq.name, log_change_seq.next_value() + count - 1))).scalar()
+        numbered = (
+            select(model.id, (last - count + func.row_number().over(order_by=model.id)).label("change_seq"))
+            .where(model.change_seq.is_(None))
+            .subquery()
+        )
+        db.execute(
+            update(model)
+            .where(model.id == numbered.c.id)
+            .values(change_seq=numbered.c.change_seq)
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+    return counts
+
+
+def main(argv=None):
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain delta sync state.")
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        counts = backfill_change_seq(db)
+    finally:
+        db.close()
+    for resource, count in counts.items():
+        print(f"numbered {count} {resource} logs")
+
+
+if __name__ == "__main__":
+    main()
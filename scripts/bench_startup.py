@@ -0,0 +1,101 @@
+"""
+Startup benchmark for the API.
+
+Imports ``app.main`` in a fresh interpreter under ``-X importtime`` and
+reports the total import time, peak RSS and the slowest imports. With
+``--check`` it exits non-zero when a budget is exceeded or when a module
+that should only load on demand (pandas, numpy, openpyxl) is imported at
+startup, so it can gate CI.
+
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --check --max-import-ms 1500 --max-rss-mb 120
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Budgets are deliberately loose; tighten them as startup gets leaner.
+DEFAULT_MAX_IMPORT_MS = 1500
+DEFAULT_MAX_RSS_MB = 120
+LAZY_MODULES = ["pandas", "numpy", "openpyxl"]
+
+CHILD_SCRIPT = """
+import json, resource, sys
+import app.main
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss_kb //= 1024
+print(json.dumps({"rss_kb": rss_kb, "modules": sorted(sys.modules)}))
+"""
+
+
+def run_once():
+    env = dict(os.environ)
+    # The engine is created at import; fall back to an in-memory database so
+    # the benchmark runs without a Postgres server.
+    env.setdefault("DATABASE_URL", "sqlite://")
+    env.setdefault("SECRET_KEY", "benchmark")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_SCRIPT],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"importing app.main failed with exit code {proc.returncode}")
+
+    imports = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((int(self_us), int(cumulative_us), name.rstrip()))
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["import_ms"] = sum(self_us for self_us, _, _ in imports) / 1000
+    result["imports"] = imports
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh interpreters to measure")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to list")
+    parser.add_argument("--check", action="store_true", help="exit 1 when a budget is exceeded")
+    parser.add_argument("--max-import-ms", type=float, default=DEFAULT_MAX_IMPORT_MS)
+    parser.add_argument("--max-rss-mb", type=float, default=DEFAULT_MAX_RSS_MB)
+    args = parser.parse_args(argv)
+
+    runs = [run_once() for _ in range(args.runs)]
+    import_ms = statistics.median(run["import_ms"] for run in runs)
+    rss_mb = statistics.median(run["rss_kb"] for run in runs) / 1024
+    loaded_lazy = [name for name in LAZY_MODULES if name in runs[-1]["modules"]]
+
+    print(f"import app.main: {import_ms:.1f} ms (median of {args.runs}), peak RSS {rss_mb:.1f} MB")
+    print("slowest imports (cumulative):")
+    slowest = sorted(runs[-1]["imports"], key=lambda item: item[1], reverse=True)[:args.top]
+    for _, cumulative_us, name in slowest:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name.strip()}")
+
+    failures = []
+    if import_ms > args.max_import_ms:
+        failures.append(f"import time {import_ms:.1f} ms exceeds budget of {args.max_import_ms:.0f} ms")
+    if rss_mb > args.max_rss_mb:
+        failures.append(f"peak RSS {rss_mb:.1f} MB exceeds budget of {args.max_rss_mb:.0f} MB")
+    if loaded_lazy:
+        failures.append(f"modules that should load on demand were imported at startup: {', '.join(loaded_lazy)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if args.check and failures:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())